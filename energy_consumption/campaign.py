@@ -0,0 +1,467 @@
+import glob
+import json
+import logging
+import sys
+import threading
+import time
+from os import path, getcwd
+
+import psutil
+
+from energy_consumption.data_streams.intel_power_gadget import IntelPowerGadget, read_ipg
+from energy_consumption.data_streams.rapl import RaplPowerGadget
+from energy_consumption.data_streams.sampled_data import PerformanceCounterRetriever, HarnessOverheadRetriever, \
+    get_now, get_clock_anchor
+from energy_consumption.experiment import ExperimentMeta, Tasks, Task, start_client
+from energy_consumption.helpers.io_helpers import make_dir, pin_proc_tree, write_json_atomic, CAN_PIN_CPUS
+from energy_consumption.helpers.time_helpers import monotonic, monotonic_ns
+from energy_consumption.marionette_session import SharedMarionette
+from mixins import NameMixin
+
+logger = logging.getLogger(__name__)
+
+
+class PageTasks(Tasks):
+    """ Default campaign item: load the page and stay on it for `dwell_time` seconds"""
+
+    def __init__(self, uri, dwell_time=60):
+        super(PageTasks, self).__init__()
+        self.uri = uri
+        self.dwell_time = dwell_time
+
+    @property
+    def tasks(self):
+        return [
+            Task("self.client.navigate('{}')".format(self.uri), self.client, meta={'website': self.uri}),
+            Task('time.sleep({})'.format(self.dwell_time), self.client, meta={'website': self.uri}),
+        ]
+
+
+class CampaignItem(ExperimentMeta):
+    """ One page of a Campaign: its own directory, power gadget file and task log, as an Experiment would have"""
+
+    def __init__(self, exp_id, exp_name, uri, **kwargs):
+        """
+        Kwargs:
+            exp_dir_path: str
+            measure_power: bool. Default True. Whether the item has a power gadget recording
+        """
+        super(CampaignItem, self).__init__(exp_id, exp_name, **kwargs)
+        self.uri = uri
+        self.measure_power = kwargs.get('measure_power', True)
+        self.clock_anchor = None
+        self.results = []
+        self.overhead = {}
+
+    @property
+    def ipg_results_path(self):
+        return path.join(self.exp_dir_path, 'ipg_{}'.format(self.exp_id))
+
+    @property
+    def failure_file_path(self):
+        return path.join(self.exp_dir_path, 'failure.alert')
+
+    def validate(self):
+        """ Whether the item's directory holds a complete, uncontaminated run"""
+        return (path.isfile(self.experiment_file_path) and not path.isfile(self.failure_file_path) and
+                (not self.measure_power or bool(glob.glob(self.ipg_results_path + '*clean.txt'))))
+
+    def fail(self):
+        make_dir(self.exp_dir_path)
+        with open(self.failure_file_path, 'w') as f:
+            f.write('Experimental data in this directory could be contaminated!\nUse at own risk!')
+
+    def log(self, action):
+        self.results.append({'timestamp': get_now(), 'timestamp_ns': monotonic_ns(),
+                             'action': '{}: {} {}/{}'.format(self.name, action, self.exp_id, self.exp_name)})
+
+    def serialize(self):
+        with open(self.experiment_file_path, 'wb') as f:
+            json.dump(self.results, f, indent=4, sort_keys=True)
+        with open(self.clock_anchor_file_path, 'w') as f:
+            json.dump(self.clock_anchor, f, indent=4, sort_keys=True)
+
+    def start(self):
+        make_dir(self.exp_dir_path, clear=True)
+        self.clock_anchor = get_clock_anchor()
+        self.log('Starting')
+
+
+class CampaignManifest(NameMixin):
+    """
+    Durable status of each item of a campaign, rewritten atomically on every change, so a crashed campaign can be
+    resumed where it stopped. Items still marked running were interrupted and are run again.
+    """
+    FILE_NAME = 'campaign_manifest.json'
+    PENDING = 'pending'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+
+    def __init__(self, campaign_dir_path, items):
+        """
+        :param campaign_dir_path: str
+        :param items: list of (exp_id, uri)
+        """
+        self.file_path = path.join(campaign_dir_path, self.FILE_NAME)
+        self.entries = [{'exp_id': exp_id, 'uri': uri, 'status': self.PENDING, 'attempts': 0,
+                         'exp_dir_path': path.join(campaign_dir_path, 'exp_{:03d}_{}'.format(i, exp_id)),
+                         'started': None, 'finished': None}
+                        for i, (exp_id, uri) in enumerate(items)]
+
+    @classmethod
+    def read_items(cls, campaign_dir_path):
+        """ (exp_id, uri) items recorded in the manifest under campaign_dir_path, None if there is none"""
+        file_path = path.join(campaign_dir_path, cls.FILE_NAME)
+        if not path.isfile(file_path):
+            return None
+        with open(file_path, 'r') as f:
+            return [(entry['exp_id'], entry['uri']) for entry in json.load(f)['entries']]
+
+    def load(self):
+        """ Pick up the recorded statuses, if this campaign has a manifest already"""
+        if not path.isfile(self.file_path):
+            return False
+        with open(self.file_path, 'r') as f:
+            entries = json.load(f)['entries']
+        if [(entry['exp_id'], entry['uri']) for entry in entries] != [(entry['exp_id'], entry['uri'])
+                                                                      for entry in self.entries]:
+            raise ValueError('{}: {} is for a different list of items'.format(self.name, self.file_path))
+        self.entries = entries
+        return True
+
+    def dump(self):
+        write_json_atomic(self.file_path, {'entries': self.entries})
+
+    def update(self, i, status):
+        entry = self.entries[i]
+        entry['status'] = status
+        if status == self.RUNNING:
+            entry['attempts'] += 1
+            entry['started'] = get_now()
+            entry['finished'] = None
+        else:
+            entry['finished'] = get_now()
+        self.dump()
+
+    @property
+    def num_completed(self):
+        return sum(1 for entry in self.entries if entry['status'] == self.COMPLETED)
+
+
+class Campaign(NameMixin):
+    """
+    Runs a list of (exp_id, uri) items in one Firefox session: Firefox, the Marionette session and the sampled data
+    retrievers are started once and stay up across items. Between items the browser is reset to about:blank, the
+    retrievers are rotated into the next item's directory (see SampledDataRetriever.rotate) and a fresh power gadget
+    recording is started, so each item still gets its own directory laid out as an Experiment's.
+
+    The time each item spends outside its tasks (setup: rotating, starting the power gadget; teardown: waiting for it,
+    resetting the browser) is written to `overhead_file_path`, along with the one-off startup and shutdown costs.
+
+    Progress is kept in a CampaignManifest. Running the same campaign again resumes it: items completed with a valid
+    directory are skipped, while failed (failure.alert) and interrupted ones are run again.
+    """
+    RESET_URI = 'about:blank'
+
+    def __init__(self, campaign_name, items, sampled_data_retrievers=None, **kwargs):
+        """
+        :param campaign_name: str. Also the exp_name of every item
+        :param items: list of (exp_id, uri)
+        :param sampled_data_retrievers: tuple. Contains various SampledDataRetriever
+        :param kwargs:
+            duration: float. Default 60. Seconds the power gadget records for, per item
+            tasks_factory: callable. Called with (exp_id, uri), returns the item's Tasks. Default PageTasks staying on
+                the page for `duration`
+            settle_time: float. Default 5. Seconds on about:blank between items
+            campaign_dir_path: str. Default the latest unfinished campaign_<campaign_name>_* directory with the same
+                items in the working directory when resuming, else campaign_<campaign_name>_<timestamp>
+            resume: bool. Default True. Skip the items already completed in campaign_dir_path
+            power_gadget_cls: class. Default IntelPowerGadget, or RaplPowerGadget on Linux. None records counters only
+            measure_overhead: bool. Default True. Add a HarnessOverheadRetriever
+            share_session: bool. Default True. Tasks and Marionette-based retrievers share one SharedMarionette session
+            ipg_timeout: float. Default 60. Seconds to wait for the power gadget beyond the item's duration
+            marionette_port: int. Default 2828
+            headless: bool. Default False
+            profile: str. Firefox profile directory. Default a fresh temporary profile
+            profile_manager: ProfileManager. Default None. Launch Firefox on a fresh clone of its profile template
+                (instead of `profile`), recording cold and warm launch times in the campaign overhead
+            cpus: list of int. Default None (no pinning). CPUs to pin Firefox's processes to
+        """
+        self.campaign_name = campaign_name
+        self.items = [tuple(item) for item in items]
+        self.duration = kwargs.get('duration', 60)
+        self.tasks_factory = kwargs.get('tasks_factory',
+                                        lambda exp_id, uri: PageTasks(uri, dwell_time=self.duration))
+        self.settle_time = kwargs.get('settle_time', 5)
+        self.resume = kwargs.get('resume', True)
+        self.campaign_dir_path = kwargs.get('campaign_dir_path', None) or \
+            (self.resume and self.find_unfinished_dir()) or \
+            path.join(getcwd(), 'campaign_{}_{}'.format(campaign_name, time.strftime('%Y%m%d_%H%M%S')))
+        self.manifest = CampaignManifest(self.campaign_dir_path, self.items)
+        self.power_gadget_cls = kwargs.get('power_gadget_cls', RaplPowerGadget if sys.platform.startswith('linux')
+                                           else IntelPowerGadget)
+        self.share_session = kwargs.get('share_session', True)
+        self.ipg_timeout = kwargs.get('ipg_timeout', 60)
+        self.client_kwargs = {'marionette_port': kwargs.get('marionette_port', 2828),
+                              'headless': kwargs.get('headless', False), 'profile': kwargs.get('profile', None)}
+        self.profile_manager = kwargs.get('profile_manager', None)
+        self.cpus = kwargs.get('cpus', None)
+        if self.cpus is not None and not CAN_PIN_CPUS:
+            logger.warning('{}: CPU pinning is not supported on this platform: not pinning'.format(self.name))
+            self.cpus = None
+        self.sampled_data_retrievers = sampled_data_retrievers or (
+            PerformanceCounterRetriever(marionette_port=self.client_kwargs['marionette_port']),)
+        if kwargs.get('measure_overhead', True):
+            self.sampled_data_retrievers = tuple(self.sampled_data_retrievers) + (
+                HarnessOverheadRetriever(self.sampled_data_retrievers),)
+        self.client = None
+        self.session = None
+        self.browser_pid = None
+        self.overhead = {'startup': None, 'shutdown': None, 'profile': None, 'skipped': [], 'items': []}
+
+    @property
+    def overhead_file_path(self):
+        return path.join(self.campaign_dir_path, 'campaign_overhead.json')
+
+    @property
+    def session_stats_file_path(self):
+        return path.join(self.campaign_dir_path, 'marionette_session_stats.json')
+
+    def find_unfinished_dir(self):
+        dir_paths = sorted(glob.glob(path.join(getcwd(), 'campaign_{}_*'.format(self.campaign_name))), reverse=True)
+        for dir_path in dir_paths:
+            if CampaignManifest.read_items(dir_path) != self.items:
+                continue
+            manifest = CampaignManifest(dir_path, self.items)
+            manifest.load()
+            if manifest.num_completed < len(self.items):
+                return dir_path
+        return None
+
+    def load_manifest(self):
+        make_dir(self.campaign_dir_path)
+        if self.resume and self.manifest.load():
+            logger.info('{}: resuming {}, {} of {} items completed'.format(
+                self.name, self.campaign_dir_path, self.manifest.num_completed, len(self.items)))
+        self.manifest.dump()
+
+    def is_done(self, i, item):
+        """ Completed in an earlier run, with its results intact"""
+        if self.manifest.entries[i]['status'] != CampaignManifest.COMPLETED:
+            return False
+        if item.validate():
+            return True
+        logger.warning('{}: {} was completed but its results are incomplete: running it again'.format(
+            self.name, item.exp_dir_path))
+        return False
+
+    def initialize(self):
+        start = monotonic()
+        if self.profile_manager is not None:
+            self.client_kwargs['profile'] = self.profile_manager.clone()
+        logger.info('{}: connecting to Marionette and beginning session'.format(self.name))
+        launch_start = monotonic()
+        client = start_client(self.share_session, **self.client_kwargs)
+        if self.profile_manager is not None:
+            self.overhead['profile'] = self.profile_manager.report(self.client_kwargs['profile'],
+                                                                   monotonic() - launch_start)
+        self.browser_pid = client.session_capabilities.get('moz:processID')
+        if self.share_session:
+            self.session = SharedMarionette(client)
+            for data_retriever in self.sampled_data_retrievers:
+                data_retriever.use_session(self.session)
+            self.client = self.session.proxy(self.name)
+        else:
+            self.client = client
+        self.reset_browser()
+        # sample until finalize; anything sampled outside an item lands in the campaign directory
+        for data_retriever in self.sampled_data_retrievers:
+            data_retriever.run(None, self.campaign_dir_path)
+        self.overhead['startup'] = monotonic() - start
+
+    def pin_browser(self):
+        """ Pin Firefox's processes, including content processes started since the last time, to `cpus`"""
+        if self.cpus is not None and self.browser_pid is not None:
+            pin_proc_tree(self.browser_pid, self.cpus)
+
+    def reset_browser(self):
+        self.client.navigate(self.RESET_URI)
+        time.sleep(self.settle_time)
+
+    def make_item(self, i):
+        entry = self.manifest.entries[i]
+        return CampaignItem(entry['exp_id'], self.campaign_name, entry['uri'], exp_dir_path=entry['exp_dir_path'],
+                            measure_power=self.power_gadget_cls is not None)
+
+    def run_item(self, item):
+        logger.info('{}: running {} ({})'.format(self.name, item.exp_id, item.uri))
+        setup_start = monotonic()
+        item.start()
+        self.pin_browser()
+        for data_retriever in self.sampled_data_retrievers:
+            data_retriever.rotate(item.exp_dir_path)
+        ipg = None
+        if self.power_gadget_cls is not None:
+            ipg = self.power_gadget_cls(duration=self.duration, output_file_path=item.ipg_results_path)
+        tasks_start = monotonic()
+        try:
+            tasks = self.tasks_factory(item.exp_id, item.uri)
+            tasks.client = self.client
+            item.results.extend(tasks.run(task_listeners=self.sampled_data_retrievers))
+        finally:
+            tasks_end = monotonic()
+            item.log('Ending')
+            item.serialize()
+            try:
+                if ipg is not None:
+                    ipg_file_path = ipg.wait(
+                        timeout=max(0, self.duration + self.ipg_timeout - (tasks_end - tasks_start)))
+                    read_ipg(ipg_file_path).to_csv(ipg_file_path.replace(ipg.output_file_ext, 'clean.txt'),
+                                                   index=False)
+            finally:
+                # the next item starts from a blank page whatever happened in this one
+                self.reset_browser()
+                teardown_end = monotonic()
+                item.overhead = {'exp_id': item.exp_id, 'uri': item.uri, 'exp_dir_path': item.exp_dir_path,
+                                 'setup': tasks_start - setup_start, 'tasks': tasks_end - tasks_start,
+                                 'teardown': teardown_end - tasks_end, 'total': teardown_end - setup_start}
+                self.overhead['items'].append(item.overhead)
+
+    def run(self):
+        self.load_manifest()
+        todo = []
+        for i in range(len(self.items)):
+            item = self.make_item(i)
+            if self.is_done(i, item):
+                self.overhead['skipped'].append(item.exp_dir_path)
+            else:
+                todo.append((i, item))
+        if not todo:
+            logger.info('{}: all {} items already completed'.format(self.name, len(self.items)))
+            return
+        try:
+            self.initialize()
+            for i, item in todo:
+                self.manifest.update(i, CampaignManifest.RUNNING)
+                try:
+                    self.run_item(item)
+                except Exception as e:
+                    logger.error('{}: {} failed due to {}'.format(self.name, item.exp_id, e))
+                    item.fail()
+                    self.manifest.update(i, CampaignManifest.FAILED)
+                else:
+                    self.manifest.update(i, CampaignManifest.COMPLETED)
+        finally:
+            self.finalize()
+
+    def finalize(self):
+        start = monotonic()
+        try:
+            running = [data_retriever for data_retriever in self.sampled_data_retrievers if data_retriever.thread]
+            for data_retriever in running:
+                data_retriever.rotate(self.campaign_dir_path)
+                data_retriever.stop()
+            for data_retriever in running:
+                data_retriever.join(timeout=10 * data_retriever.interval)
+            if self.session is not None:
+                with open(self.session_stats_file_path, 'w') as f:
+                    json.dump(self.session.stats, f, indent=4, sort_keys=True)
+            if self.client is not None:
+                self.client.quit(in_app=True)
+        finally:
+            if self.profile_manager is not None:
+                self.profile_manager.remove(self.client_kwargs['profile'])
+        self.overhead['shutdown'] = monotonic() - start
+        with open(self.overhead_file_path, 'w') as f:
+            json.dump(self.overhead, f, indent=4, sort_keys=True)
+
+
+class ParallelCampaign(NameMixin):
+    """
+    Counter-only campaigns on several headless Firefox instances side by side. The items are dealt out round-robin,
+    so each instance's share (and so its resumable Campaign) is the same from one run to the next. Instance i gets
+    Marionette port base_port + i, a profile of its own, its own retrievers, and its Firefox processes pinned to its
+    own `cpus_per_instance` CPUs.
+
+    There is no power gadget: power cannot be attributed to one of several browsers sharing the package. Instances run
+    as threads of this process, so the harness itself is not pinned.
+    """
+
+    def __init__(self, campaign_name, items, num_instances=None, **kwargs):
+        """
+        :param campaign_name: str. Instance i runs Campaign <campaign_name>_<i>
+        :param items: list of (exp_id, uri)
+        :param num_instances: int. Default as many as there are CPUs for
+        :param kwargs:
+            base_port: int. Default 2828
+            cpus_per_instance: int. Default 1. None disables pinning, as does a platform without CPU affinity (macOS).
+                Instances must fit on the machine's CPUs without overlapping
+            retrievers_factory: callable. Called with the instance's Marionette port, returns its tuple of
+                SampledDataRetriever. Default a PerformanceCounterRetriever
+            headless: bool. Default True
+            profile: not accepted, as the instances would share it: use profile_manager
+            Any other kwargs are passed on to each Campaign (e.g., duration, tasks_factory, settle_time). A
+                profile_manager is shared: its template is built once and each instance launches on a clone of it
+        """
+        self.campaign_name = campaign_name
+        self.items = list(items)
+        self.base_port = kwargs.pop('base_port', 2828)
+        self.cpus_per_instance = kwargs.pop('cpus_per_instance', 1)
+        if self.cpus_per_instance is not None and not CAN_PIN_CPUS:
+            logger.warning('{}: CPU pinning is not supported on this platform: not pinning'.format(self.name))
+            self.cpus_per_instance = None
+        if kwargs.get('profile', None) is not None:
+            raise ValueError('{}: instances cannot share one profile: pass a profile_manager to give each instance a '
+                             'clone of a template instead'.format(self.name))
+        num_cpus = psutil.cpu_count()
+        self.num_instances = num_instances or max(1, num_cpus // (self.cpus_per_instance or 1))
+        if self.cpus_per_instance is not None and self.num_instances * self.cpus_per_instance > num_cpus:
+            raise ValueError('{}: {} instances of {} CPUs do not fit on {} CPUs: run fewer instances, or pass '
+                             'cpus_per_instance=None not to pin'.format(self.name, self.num_instances,
+                                                                       self.cpus_per_instance, num_cpus))
+        retrievers_factory = kwargs.pop('retrievers_factory',
+                                        lambda port: (PerformanceCounterRetriever(marionette_port=port),))
+        if kwargs.pop('power_gadget_cls', None) is not None:
+            logger.warning('{}: power is not recorded when running instances in parallel'.format(self.name))
+        kwargs.setdefault('headless', True)
+        self.campaigns = []
+        for i in range(self.num_instances):
+            port = self.base_port + i
+            cpus = None
+            if self.cpus_per_instance is not None:
+                cpus = range(i * self.cpus_per_instance, (i + 1) * self.cpus_per_instance)
+            self.campaigns.append(Campaign('{}_{}'.format(campaign_name, i), self.items[i::self.num_instances],
+                                           retrievers_factory(port), power_gadget_cls=None, marionette_port=port,
+                                           cpus=cpus, **kwargs))
+        self.errors = {}
+
+    @property
+    def report_file_path(self):
+        return path.join(getcwd(), 'campaign_{}_parallel.json'.format(self.campaign_name))
+
+    def run_campaign(self, campaign):
+        try:
+            campaign.run()
+        except Exception as e:
+            logger.error('{}: {} failed due to {}'.format(self.name, campaign.campaign_name, e))
+            self.errors[campaign.campaign_name] = str(e)
+
+    def run(self):
+        start = monotonic()
+        threads = []
+        for campaign in self.campaigns:
+            thread = threading.Thread(target=self.run_campaign, args=(campaign,))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        report = {'duration': monotonic() - start, 'errors': self.errors,
+                  'instances': [{'campaign_dir_path': campaign.campaign_dir_path,
+                                 'marionette_port': campaign.client_kwargs['marionette_port'], 'cpus': campaign.cpus,
+                                 'num_items': len(campaign.items), 'num_completed': campaign.manifest.num_completed}
+                                for campaign in self.campaigns]}
+        with open(self.report_file_path, 'w') as f:
+            json.dump(report, f, indent=4, sort_keys=True)
+        return report
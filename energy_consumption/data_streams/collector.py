@@ -0,0 +1,146 @@
+import json
+import logging
+import threading
+from multiprocessing.pool import ThreadPool
+from os import path
+
+from mixins import NameMixin
+from energy_consumption.helpers.time_helpers import DeadlineScheduler, monotonic, summarize_latencies
+
+logger = logging.getLogger(__name__)
+
+
+class SampledDataCollector(NameMixin):
+    """
+    Single-loop alternative to SampledDataRetriever.run's thread per retriever: one scheduler thread ticks every
+    `interval` seconds and hands due retrievers to a small worker pool, so all streams sample on a shared grid.
+    A retriever is due on the first tick at least retriever.current_interval after its last sample (so burst/idle
+    rates apply), and is skipped for a tick if its previous sample is still in flight. Supervised processes (e.g.,
+    IntelPowerGadget started with threaded=False) are polled on every tick.
+
+    Per-stream latency (time inside get_sample) and jitter (sample start behind its tick deadline) are written to
+    `collector_stats.json`.
+    """
+
+    def __init__(self, sampled_data_retrievers, interval=None, **kwargs):
+        """
+        :param sampled_data_retrievers: tuple. Contains various SampledDataRetriever
+        :param interval: float. Seconds between shared ticks. Default the shortest (burst) interval of the retrievers
+        :param kwargs:
+            num_workers: int. Default 2. Size of the pool running the blocking get_sample calls
+        """
+        self.retrievers = sampled_data_retrievers
+        self.interval = interval or min(min(retriever.interval, retriever.burst_interval or retriever.interval)
+                                        for retriever in self.retrievers)
+        self.num_workers = kwargs.get('num_workers', 2)
+        self.supervised = []
+        self.scheduler = None
+        self.thread = None
+        self.dir_path = None
+        self._stopped = threading.Event()
+        self.latencies = [[] for _ in self.retrievers]
+        self.jitters = [[] for _ in self.retrievers]
+        self.skipped = [0 for _ in self.retrievers]
+        self.errors = [0 for _ in self.retrievers]
+
+    @property
+    def file_name(self):
+        return 'collector_stats.json'
+
+    def supervise(self, process):
+        """ Poll `process` (anything with a poll method) on every tick"""
+        self.supervised.append(process)
+
+    def run(self, duration, dir_path, start=None):
+        self.thread = threading.Thread(target=self.collect, args=(duration, dir_path, start))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """ End sampling before `duration` is up: samples are then dumped as usual"""
+        self._stopped.set()
+        if self.scheduler is not None:
+            self.scheduler.stop()
+
+    def join(self, timeout=None):
+        """ :return: bool. Whether the collector has finished dumping"""
+        if self.thread is not None:
+            self.thread.join(timeout)
+            return not self.thread.is_alive()
+        return True
+
+    def missing_output(self):
+        missing = [file_name for retriever in self.retrievers for file_name in retriever.missing_output()]
+        if self.dir_path is not None and not path.isfile(path.join(self.dir_path, self.file_name)):
+            missing.append(self.file_name)
+        return missing
+
+    def sample(self, i, deadline):
+        retriever = self.retrievers[i]
+        start = monotonic()
+        self.jitters[i].append(start - deadline)
+        try:
+            logger.debug(retriever.message)
+            retriever.timed_append_sample()
+        except Exception as e:
+            self.errors[i] += 1
+            logger.error('{}: {} failed to sample: {}'.format(self.name, retriever.name, e))
+        self.latencies[i].append(monotonic() - start)
+
+    def collect(self, duration=None, dir_path=None, start=None):
+        self.dir_path = dir_path
+        for retriever in self.retrievers:
+            retriever.open_output(dir_path)
+        pool = ThreadPool(self.num_workers)
+        in_flight = [None for _ in self.retrievers]
+        next_due = [None for _ in self.retrievers]
+        # half a tick of slack so float error in the deadlines never pushes a retriever onto the following tick
+        slack = self.interval / 2.0
+        self.scheduler = DeadlineScheduler(self.interval, duration, start=start)
+        for tick in self.scheduler:
+            if self._stopped.is_set():
+                break
+            deadline = self.scheduler.deadline(tick)
+            for i, retriever in enumerate(self.retrievers):
+                if next_due[i] is not None and deadline + slack < next_due[i]:
+                    continue
+                if in_flight[i] is not None and not in_flight[i].ready():
+                    self.skipped[i] += 1
+                    continue
+                next_due[i] = deadline + retriever.current_interval
+                in_flight[i] = pool.apply_async(self.sample, (i, deadline))
+            self.poll_supervised()
+        # let in-flight samples land, then flush all the retrievers concurrently
+        for result in in_flight:
+            if result is not None:
+                result.wait()
+        logger.debug("Dumping counters")
+        pool.map(self.dump_retriever, self.retrievers)
+        pool.close()
+        pool.join()
+        self.dump_stats(dir_path)
+
+    def dump_retriever(self, retriever):
+        try:
+            retriever.stop_sampling()
+        finally:
+            retriever.dump_counters(self.dir_path)
+
+    def poll_supervised(self):
+        for process in list(self.supervised):
+            if process.poll() is not None:
+                logger.info('{}: supervised {} has exited'.format(self.name, process.name))
+                self.supervised.remove(process)
+
+    @property
+    def stats(self):
+        streams = {}
+        for i, retriever in enumerate(self.retrievers):
+            streams[retriever.name] = {'latency': summarize_latencies(self.latencies[i]),
+                                       'jitter': summarize_latencies(self.jitters[i]),
+                                       'skipped': self.skipped[i], 'errors': self.errors[i]}
+        return {'schedule': self.scheduler.stats, 'streams': streams}
+
+    def dump_stats(self, dir_path):
+        with open(path.join(dir_path, self.file_name), 'w') as f:
+            json.dump(self.stats, f, indent=4, sort_keys=True)
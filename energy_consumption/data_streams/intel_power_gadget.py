@@ -1,21 +1,45 @@
+import csv
+import json
 import logging
+import mmap
+import numpy as np
 import pandas as pd
 import subprocess
 import sys
-import re
-from StringIO import StringIO
 import threading
+import time
 
 from os import path
 
 from mixins import NameMixin
-from energy_consumption.helpers.io_helpers import read_txt_file
+from energy_consumption.helpers.time_helpers import monotonic_ns
 
 logger = logging.getLogger(__name__)
 
 
 class IntelPowerGadget(NameMixin):
+    """
+    Runs PowerLog in a subprocess. `completed` is set the moment PowerLog exits: wait on it (or call wait) instead of
+    sleeping out the duration and polling for the output file.
+
+    With `segment_duration`, PowerLog is instead relaunched every segment_duration seconds into numbered segment
+    files, each started as soon as the previous one exits, so long runs give several small files and a crash only loses
+    the segment in progress. Launch and exit times of each segment are written to `segments_file_path`; see
+    stitch_ipg_segments for reading them back as one series.
+    """
+    FOOTER_TAG = '"Total Elapsed Time'
+
     def __init__(self, **kwargs):
+        """
+        Kwargs:
+            exe_file_path: str. Default PowerLog's install path on this platform
+            sampling_rate: int. Default 1000. Milliseconds between samples
+            duration: float. Default 10. Seconds to record for
+            output_file_path: str. Default 'powerlog'. Prefix of the output file path(s)
+            output_file_ext: str. Default '.txt'
+            segment_duration: float. Default None (a single run). Seconds per PowerLog segment
+            threaded: bool. Default True. Start recording straight away
+        """
         exe_file_path = kwargs.get('exe_file_path', self.get_exe_default_path())
         self.sampling_rate = kwargs.get('sampling_rate', 1000)
         self.output_file_ext = kwargs.get('output_file_ext', '.txt')
@@ -23,9 +47,18 @@ class IntelPowerGadget(NameMixin):
         output_file_path = kwargs.get('output_file_path', 'powerlog')
         self.output_dir_path, self.output_file_prefix = path.split(output_file_path)
         self.file_counter = 0
-        thread = threading.Thread(target=self.run, args=(exe_file_path, duration))
-        thread.daemon = True
-        thread.start()
+        self.exe_file_path = exe_file_path
+        self.duration = duration
+        self.segment_duration = kwargs.get('segment_duration', None)
+        self.segments = []
+        self.process = None
+        self.command = None
+        self.output_file_path = None
+        self.return_code = None
+        self.completed = threading.Event()
+        # threaded=False leaves starting PowerLog (start) to the caller
+        if kwargs.get('threaded', True):
+            self.start()
 
     def get_exe_default_path(self):
         platform = sys.platform.lower()
@@ -43,14 +76,405 @@ class IntelPowerGadget(NameMixin):
                                                                              self.file_counter, self.output_file_ext))
         return output_file_path
 
-    def run(self, exe_file_path, duration):
-        output_file_path = self.get_output_file_path()
-        subprocess.check_call([exe_file_path, '-duration', str(duration), '-resolution', str(self.sampling_rate),
-                               '-file', output_file_path])
+    def get_command(self, exe_file_path, duration, output_file_path):
+        return [exe_file_path, '-duration', str(duration), '-resolution', str(self.sampling_rate),
+                '-file', output_file_path]
+
+    @property
+    def segments_file_path(self):
+        return path.join(self.output_dir_path, '{}_segments.json'.format(self.output_file_prefix))
+
+    @property
+    def segmented(self):
+        return self.segment_duration is not None and self.segment_duration < self.duration
+
+    def start(self):
+        """ Launch PowerLog without blocking; a watcher thread sets `completed` when it (its last segment) exits"""
+        if self.segmented:
+            self.completed.clear()
+            self.return_code = None
+            self.segments = []
+            thread = threading.Thread(target=self.run_segments)
+            thread.daemon = True
+            thread.start()
+            return
+        self.output_file_path = self.get_output_file_path()
+        self.command = self.get_command(self.exe_file_path, self.duration, self.output_file_path)
+        self.completed.clear()
+        self.return_code = None
+        self.process = subprocess.Popen(self.command)
+        thread = threading.Thread(target=self.watch)
+        thread.daemon = True
+        thread.start()
+
+    def watch(self):
+        self.return_code = self.process.wait()
+        if self.return_code:
+            logger.error('{}: PowerLog exited with status {}'.format(self.name, self.return_code))
+        self.completed.set()
+
+    def get_segment_durations(self):
+        durations = [self.segment_duration] * int(self.duration // self.segment_duration)
+        remainder = self.duration - sum(durations)
+        # a remainder under a second is folded into the last segment rather than launching PowerLog for it
+        if remainder >= 1 or not durations:
+            durations.append(remainder)
+        else:
+            durations[-1] += remainder
+        return durations
+
+    def run_segments(self):
+        try:
+            for duration in self.get_segment_durations():
+                self.run_segment(duration)
+        finally:
+            failed = [segment['return_code'] for segment in self.segments if segment['return_code']]
+            # only fail outright if no segment recorded anything
+            if failed and len(failed) == len(self.segments):
+                self.return_code = failed[-1]
+            else:
+                self.return_code = 0
+            self.dump_segments()
+            self.completed.set()
+
+    def run_segment(self, duration):
+        self.output_file_path = self.get_output_file_path()
+        self.command = self.get_command(self.exe_file_path, duration, self.output_file_path)
+        start_ns = monotonic_ns()
+        try:
+            self.process = subprocess.Popen(self.command)
+            return_code = self.process.wait()
+        except OSError as e:
+            logger.error('{}: failed to launch PowerLog: {}'.format(self.name, e))
+            return_code = -1
+        end_ns = monotonic_ns()
+        if return_code:
+            logger.error('{}: PowerLog segment {} exited with status {}'.format(self.name, self.output_file_path,
+                                                                               return_code))
+        self.segments.append({'file_path': self.output_file_path, 'duration': duration, 'start_ns': start_ns,
+                              'end_ns': end_ns, 'return_code': return_code,
+                              'complete': is_ipg_file_complete(self.output_file_path)})
+
+    def dump_segments(self):
+        with open(self.segments_file_path, 'w') as f:
+            json.dump(self.segments, f, indent=4, sort_keys=True)
 
+    def poll(self):
+        """ Exit status of PowerLog launched by start, None while it is still running"""
+        return self.return_code if self.completed.is_set() else None
+
+    def wait(self, timeout=None):
+        """
+        Block until PowerLog exits, then check it succeeded and wrote a complete file (summary footer included).
+
+        :param timeout: float. Seconds. None waits indefinitely
+        :return: str. Output file path
+        """
+        if not self.completed.wait(timeout):
+            raise RuntimeError('{}: PowerLog still running after {} sec'.format(self.name, timeout))
+        if self.return_code:
+            raise subprocess.CalledProcessError(self.return_code, self.command)
+        if self.segments:
+            incomplete = [segment['file_path'] for segment in self.segments if not segment['complete']]
+            if incomplete:
+                logger.warning('{}: incomplete segments {}'.format(self.name, incomplete))
+            return self.output_file_path
+        if not is_ipg_file_complete(self.output_file_path):
+            raise IOError('{}: {} is missing or has no summary footer'.format(self.name, self.output_file_path))
+        return self.output_file_path
+
+
+class IpgTailReader(NameMixin):
+    """
+    Follows a PowerLog file while it is being written, parsing each complete row as it appears and publishing it
+    (a dict keyed by the header) to a callback and/or queue. Stops at the summary footer, which is parsed into
+    `summary`, or once the gadget has completed and the file holds nothing more. A None is put on the queue when done.
+    """
+
+    def __init__(self, file_path, **kwargs):
+        """
+        :param file_path: str. PowerLog output file, which need not exist yet
+        :param kwargs:
+            callback: callable. Called with each row
+            queue: Queue. Each row is put on it
+            completed: threading.Event. Set once the writer has finished (e.g., IntelPowerGadget.completed)
+            poll_interval: float. Default 0.1. Seconds between checks for new data
+        """
+        self.file_path = file_path
+        self.callback = kwargs.get('callback', None)
+        self.queue = kwargs.get('queue', None)
+        self.completed = kwargs.get('completed', None)
+        self.poll_interval = kwargs.get('poll_interval', 0.1)
+        self.header = None
+        self.rows = []
+        self.summary = {}
+        self.done = threading.Event()
+        self._stop = threading.Event()
+
+    def start(self):
+        thread = threading.Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def writer_done(self):
+        return self._stop.is_set() or (self.completed is not None and self.completed.is_set())
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+    def publish(self, row):
+        self.rows.append(row)
+        if self.callback is not None:
+            self.callback(row)
+        if self.queue is not None:
+            self.queue.put(row)
+
+    @staticmethod
+    def parse_value(value):
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
+    def parse_line(self, line):
+        """ Returns False once the footer is reached"""
+        if not line.strip():
+            return True
+        if line.startswith(IntelPowerGadget.FOOTER_TAG):
+            return False
+        values = next(csv.reader([line]))
+        if self.header is None:
+            self.header = values
+        else:
+            row = dict(zip(self.header, [self.parse_value(value) for value in values]))
+            # a float cannot hold a 64-bit TSC exactly
+            if 'RDTSC' in row:
+                row['RDTSC'] = int(values[self.header.index('RDTSC')])
+            self.publish(row)
+        return True
 
-def read_ipg(ipg_file_path):
-    txt = read_txt_file(ipg_file_path)
-    txt_clean = re.split('"Total Elapsed Time', txt)[0]
-    df = pd.read_csv(StringIO(txt_clean), quotechar='"')
-    return df
+    def run(self):
+        try:
+            while not path.isfile(self.file_path):
+                if self.writer_done():
+                    logger.warning('{}: {} never appeared'.format(self.name, self.file_path))
+                    return
+                time.sleep(self.poll_interval)
+            with open(self.file_path, 'r') as f:
+                self.follow(f)
+        finally:
+            if self.queue is not None:
+                self.queue.put(None)
+            self.done.set()
+
+    def follow(self, f):
+        partial = ''
+        while True:
+            # checked before reading, so the final read after the writer finishes is never missed
+            writer_done = self.writer_done()
+            # seeking in place clears a sticky EOF so data appended since the last read is seen
+            f.seek(0, 1)
+            chunk = f.read()
+            if not chunk:
+                if writer_done:
+                    return
+                time.sleep(self.poll_interval)
+                continue
+            lines = (partial + chunk).split('\n')
+            # the last piece is incomplete unless the chunk ended on a newline
+            partial = lines.pop()
+            for i, line in enumerate(lines):
+                if not self.parse_line(line.rstrip('\r')):
+                    self.read_footer('\n'.join(lines[i:] + [partial]), f)
+                    return
+
+    def read_footer(self, txt, f):
+        # the footer is written in one go at the end: wait for the writer to finish so all of it is there
+        while self.completed is not None and not self.writer_done():
+            time.sleep(self.poll_interval)
+        f.seek(0, 1)
+        self.summary = parse_ipg_summary(txt + f.read())
+
+
+def parse_ipg_summary(txt):
+    """ PowerLog summary footer lines, e.g. "Total Elapsed Time (sec) = 10.0", as {key: float or str}"""
+    summary = {}
+    for line in txt.splitlines():
+        line = line.strip().strip('"')
+        if '=' not in line:
+            continue
+        key, value = line.split('=', 1)
+        summary[key.strip()] = IpgTailReader.parse_value(value.strip())
+    return summary
+
+
+def is_ipg_file_complete(ipg_file_path, tail_size=16384):
+    """ Whether the PowerLog file exists and ends with its summary footer"""
+    if not path.isfile(ipg_file_path):
+        return False
+    with open(ipg_file_path, 'rb') as f:
+        f.seek(0, 2)
+        f.seek(max(0, f.tell() - tail_size))
+        return IntelPowerGadget.FOOTER_TAG in f.read()
+
+
+class BoundedReader(object):
+    """ File-like view of buf[start:end] (e.g., of an mmap), read in chunks so the region is never copied whole"""
+
+    def __init__(self, buf, start, end):
+        self.buf = buf
+        self.pos = start
+        self.end = end
+
+    def read(self, size=-1):
+        stop = self.end if size is None or size < 0 else min(self.end, self.pos + size)
+        chunk = self.buf[self.pos:stop]
+        self.pos = stop
+        return chunk
+
+    def readline(self, *_):
+        stop = self.buf.find(b'\n', self.pos, self.end)
+        return self.read(self.end - self.pos if stop < 0 else stop + 1 - self.pos)
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+
+def get_ipg_dtypes(header):
+    """ Compact dtypes for the PowerLog columns: System Time stays a string, RDTSC is an int, the rest float32"""
+    dtypes = {}
+    for column in header:
+        if column == 'System Time':
+            continue
+        dtypes[column] = np.int64 if column == 'RDTSC' else np.float32
+    return dtypes
+
+
+def read_ipg(ipg_file_path, with_summary=False):
+    """
+    Parses a PowerLog file in a single pass over a memory map of it: the footer is located once from the end, and only
+    the data region before it goes through read_csv. A file without a footer (PowerLog did not exit cleanly) is read up
+    to its last complete row.
+
+    :param ipg_file_path: str
+    :param with_summary: bool. Also return the summary footer, as parsed by parse_ipg_summary ({} if there is none)
+    :return: DataFrame, or (DataFrame, dict) with_summary
+    """
+    with open(ipg_file_path, 'rb') as f:
+        if not path.getsize(ipg_file_path):
+            raise IOError('{} is empty'.format(ipg_file_path))
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            footer_offset = mm.rfind(IntelPowerGadget.FOOTER_TAG)
+            if footer_offset < 0:
+                # cut off mid-write: drop the partial last row
+                footer_offset = mm.rfind(b'\n') + 1
+            header = next(csv.reader([mm[:mm.find(b'\n')].rstrip(b'\r')]))
+            df = pd.read_csv(BoundedReader(mm, 0, footer_offset), quotechar='"', dtype=get_ipg_dtypes(header))
+            summary = parse_ipg_summary(mm[footer_offset:]) if with_summary else None
+        finally:
+            mm.close()
+    return (df, summary) if with_summary else df
+
+
+def read_ipg_summary(ipg_file_path, tail_size=16384):
+    """ Just the summary footer of a PowerLog file, read from its tail: cheap enough for scanning whole archives"""
+    with open(ipg_file_path, 'rb') as f:
+        f.seek(0, 2)
+        f.seek(max(0, f.tell() - tail_size))
+        tail = f.read()
+    footer_offset = tail.rfind(IntelPowerGadget.FOOTER_TAG)
+    return parse_ipg_summary(tail[footer_offset:]) if footer_offset >= 0 else {}
+
+
+def scan_ipg_files(ipg_file_paths, summary_only=False):
+    """
+    Reads many archived PowerLog files one at a time, skipping (and logging) unreadable ones
+
+    :param ipg_file_paths: iterable of str
+    :param summary_only: bool. Read only the summary footers
+    :return: generator of (file path, DataFrame or None if summary_only, summary dict)
+    """
+    for ipg_file_path in ipg_file_paths:
+        try:
+            if summary_only:
+                yield ipg_file_path, None, read_ipg_summary(ipg_file_path)
+            else:
+                df, summary = read_ipg(ipg_file_path, with_summary=True)
+                yield ipg_file_path, df, summary
+        except (IOError, ValueError) as e:
+            logger.warning('Skipping {}: {}'.format(ipg_file_path, e))
+
+
+def parse_system_time(system_time):
+    """ PowerLog's System Time, e.g. 14:02:31:127, in seconds since midnight"""
+    hours, minutes, seconds, millis = system_time.split(':')
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds) + int(millis) / 1000.0
+
+
+def stitch_ipg_segments(ipg_file_paths, segments_file_path=None):
+    """
+    Reads the segment files of a segmented IntelPowerGadget run into one continuous series, with columns added:
+        Segment: int. Index into ipg_file_paths
+        Stitched Elapsed Time (sec): seconds since the first segment's start
+        Gap Before (sec): on each segment's first row, the time missing since the previous segment's last row beyond
+            one sampling interval; 0 elsewhere
+
+    Segments are placed by their launch times from `segments_file_path` (IntelPowerGadget.segments_file_path) when
+    given, else by their first row's System Time. A segment cut off mid-write (PowerLog crashed) contributes the rows
+    it completed; an unreadable one is skipped. Either way the time lost shows up as the next segment's gap.
+
+    :param ipg_file_paths: list of str. Segment files, in order
+    :param segments_file_path: str
+    :return: (DataFrame, list of dict). Per segment: file_path, complete (has its summary footer), summary, num_rows,
+        gap_before (seconds, None if it has no rows) and error (None, or why it was skipped)
+    """
+    start_ns = None
+    if segments_file_path is not None:
+        with open(segments_file_path, 'r') as f:
+            start_ns = dict((segment['file_path'], segment['start_ns']) for segment in json.load(f))
+    dfs, segments = [], []
+    prev_end = None
+    origin = None
+    for i, ipg_file_path in enumerate(ipg_file_paths):
+        segment = {'file_path': ipg_file_path, 'complete': is_ipg_file_complete(ipg_file_path), 'summary': {},
+                   'num_rows': 0, 'gap_before': None, 'error': None}
+        segments.append(segment)
+        try:
+            df, segment['summary'] = read_ipg(ipg_file_path, with_summary=True)
+        except (IOError, ValueError) as e:
+            logger.warning('Skipping segment {}: {}'.format(ipg_file_path, e))
+            segment['error'] = str(e)
+            continue
+        if not segment['complete']:
+            logger.warning('Segment {} is incomplete: reading its {} complete rows'.format(ipg_file_path, len(df)))
+        segment['num_rows'] = len(df)
+        if df.empty:
+            continue
+        elapsed = df['Elapsed Time (sec)'].values.astype(np.float64)
+        if start_ns is not None and ipg_file_path in start_ns:
+            start = start_ns[ipg_file_path] / 1e9
+        else:
+            start = parse_system_time(df['System Time'].iloc[0]) - elapsed[0]
+        if origin is None:
+            origin = start
+        # System Time wraps at midnight
+        offset = (start - origin) % 86400 if start_ns is None else start - origin
+        stitched = offset + elapsed
+        gaps = np.zeros(len(df), dtype=np.float32)
+        if prev_end is not None:
+            interval = np.median(np.diff(elapsed)) if len(elapsed) > 1 else 0
+            gaps[0] = max(0.0, stitched[0] - prev_end - interval)
+        segment['gap_before'] = float(gaps[0])
+        prev_end = stitched[-1]
+        df.insert(0, 'Segment', i)
+        df['Stitched Elapsed Time (sec)'] = stitched
+        df['Gap Before (sec)'] = gaps
+        dfs.append(df)
+    if not dfs:
+        raise ValueError('no rows in {}'.format(ipg_file_paths))
+    return pd.concat(dfs, ignore_index=True), segments
@@ -0,0 +1,57 @@
+// arguments: [action, resolution (ms), maxSize]
+// action is one of "install", "drain" or "uninstall". The buffer lives on the chrome window so it survives between
+// execute_script calls.
+let [action, resolution, maxSize] = arguments;
+const KEY = "__energyConsumptionCounterBuffer";
+
+function drain(state) {
+    let samples = state.samples.splice(0, state.samples.length);
+    let {dropped, skipped} = state;
+    state.dropped = 0;
+    state.skipped = 0;
+    return {samples, dropped, skipped, date: Cu.now()};
+}
+
+function install() {
+    if (window[KEY]) {
+        window.clearInterval(window[KEY].timer);
+    }
+    let state = {samples: [], dropped: 0, skipped: 0, pending: false, timer: null};
+    state.timer = window.setInterval(async function () {
+        // never stack requests: a snapshot slower than the resolution costs a tick instead
+        if (state.pending) {
+            state.skipped += 1;
+            return;
+        }
+        state.pending = true;
+        try {
+            let tabs = await promiseTabs();
+            state.samples.push({tabs, date: Cu.now()});
+            if (state.samples.length > maxSize) {
+                state.dropped += state.samples.length - maxSize;
+                state.samples.splice(0, state.samples.length - maxSize);
+            }
+        } finally {
+            state.pending = false;
+        }
+    }, resolution);
+    window[KEY] = state;
+    return {samples: [], dropped: 0, skipped: 0, date: Cu.now()};
+}
+
+function uninstall() {
+    let state = window[KEY];
+    if (!state) {
+        return {samples: [], dropped: 0, skipped: 0, date: Cu.now()};
+    }
+    window.clearInterval(state.timer);
+    delete window[KEY];
+    return drain(state);
+}
+
+if (action == "install") {
+    return install();
+} else if (action == "uninstall") {
+    return uninstall();
+}
+return window[KEY] ? drain(window[KEY]) : {samples: [], dropped: 0, skipped: 0, date: Cu.now()};
@@ -0,0 +1,49 @@
+// arguments: [keyframeInterval, reset]
+// Returns only the tabs (and, within them, children) that changed since the previous call, plus the ids of removed
+// ones. Every keyframeInterval calls, or when reset, the full map is returned instead. The previous snapshot lives on
+// the chrome window so it survives between execute_script calls.
+let [keyframeInterval, reset] = arguments;
+const KEY = "__energyConsumptionCounterDeltas";
+
+function sameCounts(a, b) {
+    return a.host == b.host && a.dispatchCount == b.dispatchCount && a.duration == b.duration &&
+           a.memory == b.memory;
+}
+
+function diffTab(prev, tab) {
+    let prevChildren = new Map(prev.children.map(child => [child.counterId, child]));
+    let children = tab.children.filter(child => !(prevChildren.has(child.counterId) &&
+                                                  sameCounts(prevChildren.get(child.counterId), child) &&
+                                                  prevChildren.get(child.counterId).isWorker == child.isWorker));
+    let counterIds = new Set(tab.children.map(child => child.counterId));
+    let removedChildren = prev.children.filter(child => !counterIds.has(child.counterId))
+                                       .map(child => child.counterId);
+    if (!children.length && !removedChildren.length && sameCounts(prev, tab) && prev.windowId == tab.windowId) {
+        return null;
+    }
+    let {windowId, host, dispatchCount, duration, memory} = tab;
+    return {windowId, host, dispatchCount, duration, memory, children, removedChildren};
+}
+
+async function promiseDelta() {
+
+    let tabs = await promiseTabs();
+    let date = Cu.now();
+    let state = window[KEY];
+    if (reset || !state || state.count % keyframeInterval == 0) {
+        window[KEY] = {tabs, count: 1};
+        return {keyframe: true, tabs, removed: [], date};
+    }
+    let changed = {};
+    for (let id in tabs) {
+        let delta = id in state.tabs ? diffTab(state.tabs[id], tabs[id]) : tabs[id];
+        if (delta) {
+            changed[id] = delta;
+        }
+    }
+    let removed = Object.keys(state.tabs).filter(id => !(id in tabs));
+    state.tabs = tabs;
+    state.count += 1;
+    return {keyframe: false, tabs: changed, removed, date};
+}
+return promiseDelta();
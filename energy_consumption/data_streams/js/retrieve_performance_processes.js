@@ -0,0 +1,8 @@
+async function promiseSnapshot() {
+
+    // single round-trip: counters and process info requested concurrently, stamped with one date
+    let [tabs, process] = await Promise.all([promiseTabs(), ChromeUtils.requestProcInfo()]);
+    let date = Cu.now();
+    return {tabs: {tabs, date}, processes: {process, date}};
+}
+return promiseSnapshot();
\ No newline at end of file
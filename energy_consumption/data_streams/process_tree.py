@@ -0,0 +1,210 @@
+import logging
+import os
+import sys
+from os import path
+
+import psutil
+
+from energy_consumption.data_streams.sampled_data import SampledDataRetriever
+from energy_consumption.helpers.time_helpers import monotonic, monotonic_ns
+
+logger = logging.getLogger(__name__)
+
+
+class ProcStatReader(object):
+    """
+    Linux: reads CPU times, context switches and RSS of one process straight from /proc/<pid>/stat and status.
+    The files are kept open and re-read from the start each time, so a sample costs four syscalls and no allocation
+    of per-line objects.
+    """
+    CLOCK_TICKS = float(os.sysconf('SC_CLK_TCK')) if hasattr(os, 'sysconf') else 100.0
+    PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+    READ_SIZE = 4096
+
+    def __init__(self, pid, proc_dir_path='/proc'):
+        self.pid = pid
+        self._stat_fd = os.open(path.join(proc_dir_path, str(pid), 'stat'), os.O_RDONLY)
+        self._status_fd = os.open(path.join(proc_dir_path, str(pid), 'status'), os.O_RDONLY)
+
+    def _read(self, fd):
+        os.lseek(fd, 0, os.SEEK_SET)
+        txt = os.read(fd, self.READ_SIZE)
+        if not txt:
+            raise IOError('{} has exited'.format(self.pid))
+        return txt
+
+    @staticmethod
+    def _status_value(status, key):
+        start = status.find(key)
+        if start < 0:
+            return None
+        start += len(key)
+        return int(status[start:status.find(b'\n', start)])
+
+    def read(self):
+        """ Raises IOError/OSError once the process has exited"""
+        stat = self._read(self._stat_fd)
+        status = self._read(self._status_fd)
+        # the command name may contain spaces and parentheses: fields are counted from after its closing ')'
+        fields = stat[stat.rindex(b')') + 2:].split()
+        return {'user': int(fields[11]) / self.CLOCK_TICKS, 'system': int(fields[12]) / self.CLOCK_TICKS,
+                'rss': int(fields[21]) * self.PAGE_SIZE,
+                'ctx_switches_voluntary': self._status_value(status, b'\nvoluntary_ctxt_switches:'),
+                'ctx_switches_involuntary': self._status_value(status, b'\nnonvoluntary_ctxt_switches:')}
+
+    def close(self):
+        os.close(self._stat_fd)
+        os.close(self._status_fd)
+
+
+class PsutilProcessReader(object):
+    """ Portable equivalent of ProcStatReader, batching the psutil calls with oneshot"""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self._process = psutil.Process(pid)
+
+    def read(self):
+        """ Raises psutil.NoSuchProcess once the process has exited, psutil.AccessDenied if it cannot be read"""
+        with self._process.oneshot():
+            cpu_times = self._process.cpu_times()
+            ctx_switches = self._process.num_ctx_switches()
+            rss = self._process.memory_info().rss
+        return {'user': cpu_times.user, 'system': cpu_times.system, 'rss': rss,
+                'ctx_switches_voluntary': ctx_switches.voluntary,
+                'ctx_switches_involuntary': ctx_switches.involuntary}
+
+    def close(self):
+        pass
+
+
+class FirefoxProcessTreeRetriever(SampledDataRetriever):
+    """
+    Per-process CPU times, context switches and RSS of the Firefox parent process and all its children (content, GPU,
+    extension, ...). Children are re-discovered every `discovery_interval` seconds; processes appearing or exiting
+    mid-run are reported in each sample's `started` and `exited`.
+
+    The parent is, in order of preference: the `pid` kwarg, the Marionette session's moz:processID, or the oldest
+    running process named like `process_name` whose parent is not.
+    """
+    NEEDS_BROWSER = True
+
+    def __init__(self, interval=1, **kwargs):
+        """
+        :param interval: float. Seconds between samples
+        :param kwargs:
+            pid: int. Firefox parent process id
+            process_name: str. Default 'firefox'
+            discovery_interval: float. Default 5. Seconds between scans for new child processes
+            raw_proc: bool. Default True on Linux. Read /proc directly instead of going through psutil
+        """
+        super(FirefoxProcessTreeRetriever, self).__init__(interval=interval, **kwargs)
+        logger.debug("{}: instantiating".format(self.name))
+        self.pid = kwargs.get('pid', None)
+        self.process_name = kwargs.get('process_name', 'firefox')
+        self.discovery_interval = kwargs.get('discovery_interval', 5)
+        self.raw_proc = kwargs.get('raw_proc', sys.platform.startswith('linux'))
+        self.session = None
+        self.readers = {}
+        # pids of processes we cannot read, e.g. sandboxed children: skipped from then on
+        self.denied = set()
+        self.last_discovery = None
+
+    @property
+    def message(self):
+        return '{}: sampling Firefox process tree'.format(self.name)
+
+    @property
+    def file_name(self):
+        return 'ff_process_tree_sampled_data.json'
+
+    def use_session(self, session):
+        self.session = session
+
+    def prepare(self):
+        self.discover()
+
+    def find_parent_pid(self):
+        if self.pid is not None:
+            return self.pid
+        if self.session is not None:
+            pid = self.session.client.session_capabilities.get('moz:processID')
+            if pid:
+                return pid
+        candidates = [p for p in psutil.process_iter(attrs=['name', 'ppid', 'create_time'])
+                      if self.process_name in (p.info['name'] or '').lower()]
+        candidate_pids = set(p.pid for p in candidates)
+        parents = [p for p in candidates if p.info['ppid'] not in candidate_pids]
+        if not parents:
+            raise ValueError('{}: no running {} process found'.format(self.name, self.process_name))
+        return min(parents, key=lambda p: p.info['create_time']).pid
+
+    @staticmethod
+    def get_process_type(process):
+        """ 'parent', or a child's type from the end of its -contentproc command line (e.g., 'tab', 'gpu')"""
+        try:
+            cmdline = process.cmdline()
+        except psutil.Error:
+            return 'unknown'
+        if '-contentproc' not in cmdline:
+            return 'parent'
+        return cmdline[-1]
+
+    def make_reader(self, pid):
+        return ProcStatReader(pid) if self.raw_proc else PsutilProcessReader(pid)
+
+    def discover(self):
+        """ Opens readers for processes new to the tree. Returns {pid: info} of those started"""
+        if self.pid is None:
+            self.pid = self.find_parent_pid()
+            logger.info('{}: Firefox parent process is {}'.format(self.name, self.pid))
+        self.last_discovery = monotonic()
+        try:
+            parent = psutil.Process(self.pid)
+            processes = [parent] + parent.children(recursive=True)
+        except psutil.Error as e:
+            # e.g., Firefox has quit: the processes still being read are reported as they exit
+            logger.debug('{}: cannot list the processes of {}: {}'.format(self.name, self.pid, e))
+            return {}
+        started = {}
+        for process in processes:
+            if process.pid in self.readers or process.pid in self.denied:
+                continue
+            try:
+                info = {'name': process.name(), 'type': self.get_process_type(process), 'ppid': process.ppid()}
+                self.readers[process.pid] = self.make_reader(process.pid)
+                started[process.pid] = info
+            except psutil.AccessDenied as e:
+                self.deny(process.pid, e)
+            except (psutil.Error, IOError, OSError):
+                continue
+        return started
+
+    def deny(self, pid, e):
+        """ Stop trying to read a process we have no access to"""
+        logger.warning('{}: not sampling process {}: {}'.format(self.name, pid, e))
+        self.denied.add(pid)
+
+    def get_sample(self, **_):
+        started = {}
+        if self.last_discovery is None or monotonic() - self.last_discovery >= self.discovery_interval:
+            started = self.discover()
+        processes = {}
+        exited = []
+        for pid, reader in list(self.readers.items()):
+            try:
+                processes[pid] = reader.read()
+            except psutil.AccessDenied as e:
+                reader.close()
+                del self.readers[pid]
+                self.deny(pid, e)
+            except (psutil.Error, IOError, OSError):
+                reader.close()
+                del self.readers[pid]
+                exited.append(pid)
+        return {'timestamp_ns': monotonic_ns(), 'processes': processes, 'started': started, 'exited': exited}
+
+    def stop_sampling(self):
+        for reader in self.readers.values():
+            reader.close()
+        self.readers = {}
@@ -0,0 +1,120 @@
+import logging
+import threading
+
+from mixins import NameMixin
+from energy_consumption.data_streams.sampled_data import apply_counter_delta
+from energy_consumption.helpers.time_helpers import monotonic_ns
+
+logger = logging.getLogger(__name__)
+
+
+def get_counter_tabs(sample, tabs=None):
+    """
+    Full {tab id: tab} map of a performance counter sample from any PerformanceCounterRetriever.
+
+    :param sample: dict. As written by the retriever
+    :param tabs: dict. Previous full map, needed to apply delta-encoded samples
+    :return: dict, or None for a delta with nothing to apply it to
+    """
+    snapshot = sample['tabs']
+    if 'keyframe' in snapshot:
+        if tabs is None and not snapshot['keyframe']:
+            return None
+        return apply_counter_delta(tabs, snapshot)
+    return snapshot['tabs']
+
+
+class QuiescenceMonitor(NameMixin):
+    """
+    Watches the live streams for the browser settling down: performance counter samples (subscribe it to a
+    PerformanceCounterRetriever with `counter_retriever`) and, optionally, power rows (pass `on_power_row` as an
+    Experiment's ipg_callback). A counter interval is active when tabs dispatched more than `max_dispatch_rate`
+    runnables/sec or were busy more than `max_busy_fraction` of the time; a power row is active above `max_power`.
+
+    wait_for_quiescence returns once nothing has been active for a whole window.
+    """
+
+    def __init__(self, counter_retriever=None, **kwargs):
+        """
+        :param counter_retriever: PerformanceCounterRetriever. Its samples are watched as they are written
+        :param kwargs:
+            max_dispatch_rate: float. Default 20. Dispatches/sec across all tabs
+            max_busy_fraction: float. Default 0.01. Fraction of wall time the tabs spent running
+            max_power: float. Default None (power not watched). Watts
+            power_column: str. Default 'Processor Power_0(Watt)'
+        """
+        self.max_dispatch_rate = kwargs.get('max_dispatch_rate', 20)
+        self.max_busy_fraction = kwargs.get('max_busy_fraction', 0.01)
+        self.max_power = kwargs.get('max_power', None)
+        self.power_column = kwargs.get('power_column', 'Processor Power_0(Watt)')
+        self._condition = threading.Condition(threading.Lock())
+        self.tabs = None
+        self.last_sample_ns = None
+        self.last_active_ns = None
+        self.last_observed_ns = None
+        self.last_activity = {}
+        if counter_retriever is not None:
+            counter_retriever.add_sample_listener(self.on_counter_sample)
+
+    def get_activity(self, tabs, elapsed_ns):
+        """ Dispatch rate and busy fraction of the tabs since the previous sample. Tabs new since then count in full"""
+        dispatches = duration_us = 0
+        for tab_id, tab in tabs.items():
+            prev = self.tabs.get(tab_id, {})
+            dispatches += max(0, tab['dispatchCount'] - prev.get('dispatchCount', 0))
+            duration_us += max(0, tab['duration'] - prev.get('duration', 0))
+        return {'dispatch_rate': dispatches / (elapsed_ns / 1e9), 'busy_fraction': duration_us * 1e3 / elapsed_ns}
+
+    def on_counter_sample(self, sample):
+        tabs = get_counter_tabs(sample, self.tabs)
+        if tabs is None:
+            return
+        timestamp_ns = sample['timestamp_ns']
+        if self.tabs is not None and timestamp_ns > self.last_sample_ns:
+            activity = self.get_activity(tabs, timestamp_ns - self.last_sample_ns)
+            self.observe(timestamp_ns, activity, activity['dispatch_rate'] > self.max_dispatch_rate or
+                         activity['busy_fraction'] > self.max_busy_fraction)
+        self.tabs = tabs
+        self.last_sample_ns = timestamp_ns
+
+    def on_power_row(self, row):
+        if self.max_power is None or self.power_column not in row:
+            return
+        power = row[self.power_column]
+        self.observe(monotonic_ns(), {'power': power}, power > self.max_power)
+
+    def observe(self, timestamp_ns, activity, active):
+        with self._condition:
+            self.last_observed_ns = timestamp_ns
+            self.last_activity.update(activity)
+            if active:
+                self.last_active_ns = timestamp_ns
+            self._condition.notify_all()
+
+    def wait_for_quiescence(self, window=5, timeout=60):
+        """
+        Block until no activity has been observed for `window` seconds (at least one observation must fall inside it),
+        or `timeout` seconds have passed.
+
+        :return: dict. settled: bool, elapsed: seconds waited, activity: the latest rates observed
+        """
+        start_ns = monotonic_ns()
+        window_ns, timeout_ns = int(window * 1e9), int(timeout * 1e9)
+        settled = False
+        with self._condition:
+            while True:
+                now_ns = monotonic_ns()
+                quiet_since_ns = max(start_ns, self.last_active_ns or start_ns)
+                if now_ns - quiet_since_ns >= window_ns and self.last_observed_ns is not None and \
+                        self.last_observed_ns > quiet_since_ns:
+                    settled = True
+                    break
+                if now_ns - start_ns >= timeout_ns:
+                    break
+                # woken by each observation; the timeout also catches the window elapsing between them
+                self._condition.wait(min(timeout_ns - (now_ns - start_ns), window_ns) / 1e9)
+            activity = dict(self.last_activity)
+        elapsed = (monotonic_ns() - start_ns) / 1e9
+        if not settled:
+            logger.warning('{}: still active after {:.1f} sec: {}'.format(self.name, elapsed, activity))
+        return {'settled': settled, 'elapsed': elapsed, 'activity': activity}
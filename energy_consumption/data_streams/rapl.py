@@ -0,0 +1,234 @@
+import csv
+import glob
+import logging
+import re
+import threading
+from datetime import datetime
+from os import path
+
+import psutil
+
+from mixins import NameMixin
+from energy_consumption.helpers.time_helpers import DeadlineScheduler, monotonic, monotonic_ns
+
+logger = logging.getLogger(__name__)
+
+
+class RaplZone(object):
+    """ One intel-rapl powercap zone: a cumulative, wrapping energy counter in micro-joules"""
+
+    def __init__(self, zone_dir_path):
+        self.zone_dir_path = zone_dir_path
+        with open(path.join(zone_dir_path, 'name'), 'r') as f:
+            self.zone_name = f.read().strip()
+        with open(path.join(zone_dir_path, 'max_energy_range_uj'), 'r') as f:
+            self.max_energy_range_uj = int(f.read())
+        # socket from the zone id, e.g. intel-rapl:1:0 is a subzone of package 1
+        self.socket = int(re.match(r'intel-rapl:(\d+)', path.basename(zone_dir_path)).group(1))
+        self._energy_file = open(path.join(zone_dir_path, 'energy_uj'), 'r')
+        self.last_energy_uj = None
+        self.cumulative_joules = 0.0
+
+    @property
+    def domain(self):
+        """ package, core, uncore, dram or psys"""
+        return self.zone_name.split('-')[0]
+
+    def reset(self):
+        self.last_energy_uj = None
+        self.cumulative_joules = 0.0
+
+    def read_energy_uj(self):
+        self._energy_file.seek(0)
+        return int(self._energy_file.read())
+
+    def update(self):
+        """ Reads the counter and returns the joules used since the last update, accounting for wraparound"""
+        energy_uj = self.read_energy_uj()
+        if self.last_energy_uj is None:
+            delta_uj = 0
+        elif energy_uj >= self.last_energy_uj:
+            delta_uj = energy_uj - self.last_energy_uj
+        else:
+            delta_uj = energy_uj + self.max_energy_range_uj + 1 - self.last_energy_uj
+        self.last_energy_uj = energy_uj
+        joules = delta_uj / 1e6
+        self.cumulative_joules += joules
+        return joules
+
+    def close(self):
+        self._energy_file.close()
+
+
+class RaplPowerGadget(NameMixin):
+    """
+    Linux replacement for IntelPowerGadget: samples the intel-rapl energy counters under
+    /sys/class/powercap every `sampling_rate` ms and writes a PowerLog-style file (same columns and summary footer),
+    so read_ipg and everything downstream of it work unchanged. Rows are written as they are sampled. There is no
+    TSC to read: the RDTSC column holds monotonic_ns instead.
+
+    RAPL domains map onto PowerLog's: package -> Processor, core -> IA, uncore -> GT, dram -> DRAM.
+    """
+    DOMAIN_LABELS = (('package', 'Processor'), ('core', 'IA'), ('uncore', 'GT'), ('dram', 'DRAM'))
+    JOULES_PER_MWH = 3.6
+    # reading the counters cannot crash mid-run the way PowerLog can: always one file (segment_duration is ignored)
+    segmented = False
+
+    def __init__(self, **kwargs):
+        """
+        Kwargs:
+            sampling_rate: int. Default 1000. Milliseconds between samples
+            duration: float. Default 10. Seconds to record for
+            output_file_path: str. Default 'powerlog'. Prefix of the output file path, as for IntelPowerGadget
+            output_file_ext: str. Default '.txt'
+            sysfs_root_path: str. Default '/sys/class/powercap'
+            threaded: bool. Default True. Start recording in a background thread straight away
+        """
+        self.sampling_rate = kwargs.get('sampling_rate', 1000)
+        self.output_file_ext = kwargs.get('output_file_ext', '.txt')
+        self.duration = kwargs.get('duration', 10)
+        output_file_path = kwargs.get('output_file_path', 'powerlog')
+        self.output_dir_path, self.output_file_prefix = path.split(output_file_path)
+        self.sysfs_root_path = kwargs.get('sysfs_root_path', '/sys/class/powercap')
+        self.file_counter = 0
+        self.zones = self.find_zones()
+        self.thread = None
+        self.output_file_path = None
+        self.error = None
+        self.completed = threading.Event()
+        if kwargs.get('threaded', True):
+            self.start()
+
+    def find_zones(self):
+        zones = []
+        for zone_dir_path in sorted(glob.glob(path.join(self.sysfs_root_path, 'intel-rapl:*'))):
+            try:
+                zone = RaplZone(zone_dir_path)
+            except (IOError, OSError) as e:
+                raise ValueError('{}: cannot read RAPL zone {} ({}): energy_uj is often root-only'.format(
+                    self.name, zone_dir_path, e))
+            if zone.domain in dict(self.DOMAIN_LABELS):
+                zones.append(zone)
+            else:
+                zone.close()
+        if not zones:
+            raise ValueError('{}: no intel-rapl zones found under {}'.format(self.name, self.sysfs_root_path))
+        # stable column order: by domain as in DOMAIN_LABELS, then socket
+        domain_order = [domain for domain, _ in self.DOMAIN_LABELS]
+        return sorted(zones, key=lambda zone: (domain_order.index(zone.domain), zone.socket))
+
+    def get_output_file_path(self):
+        self.file_counter += 1
+        output_file_path = path.join(self.output_dir_path, '{}_{}_{}'.format(self.output_file_prefix,
+                                                                             self.file_counter, self.output_file_ext))
+        return output_file_path
+
+    def zone_label(self, zone):
+        return '{}_{}'.format(dict(self.DOMAIN_LABELS)[zone.domain], zone.socket)
+
+    def get_header(self):
+        header = ['System Time', 'RDTSC', 'Elapsed Time (sec)', 'CPU Utilization(%)', 'CPU Frequency_0(MHz)']
+        for zone in self.zones:
+            label = self.zone_label(zone)
+            name, socket = label.rsplit('_', 1)
+            header.extend(['{} Power_{}(Watt)'.format(name, socket),
+                           'Cumulative {} Energy_{}(Joules)'.format(name, socket),
+                           'Cumulative {} Energy_{}(mWh)'.format(name, socket)])
+        return header
+
+    @staticmethod
+    def format_system_time(now):
+        """ PowerLog's System Time, e.g. 14:02:31:127"""
+        return '{}:{:03d}'.format(now.strftime('%H:%M:%S'), now.microsecond // 1000)
+
+    def get_row(self, elapsed, interval):
+        row = [self.format_system_time(datetime.now()), monotonic_ns(), round(elapsed, 3),
+               psutil.cpu_percent(interval=None), self.get_cpu_frequency()]
+        for zone in self.zones:
+            joules = zone.update()
+            row.extend([joules / interval if interval else 0.0, zone.cumulative_joules,
+                        zone.cumulative_joules / self.JOULES_PER_MWH])
+        return row
+
+    @staticmethod
+    def get_cpu_frequency():
+        freq = psutil.cpu_freq()
+        return freq.current if freq is not None else 0.0
+
+    def get_footer(self, elapsed):
+        footer = ['Total Elapsed Time (sec) = {:.6f}'.format(elapsed)]
+        for zone in self.zones:
+            name, socket = self.zone_label(zone).rsplit('_', 1)
+            footer.extend([
+                'Cumulative {} Energy_{} (Joules) = {:.6f}'.format(name, socket, zone.cumulative_joules),
+                'Cumulative {} Energy_{} (mWh) = {:.6f}'.format(name, socket,
+                                                                zone.cumulative_joules / self.JOULES_PER_MWH),
+                'Average {} Power_{} (Watt) = {:.6f}'.format(name, socket,
+                                                             zone.cumulative_joules / elapsed if elapsed else 0.0)])
+        return footer
+
+    def start(self):
+        self.output_file_path = self.get_output_file_path()
+        self.completed.clear()
+        self.error = None
+        self.thread = threading.Thread(target=self.watch)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def watch(self):
+        try:
+            self.run(self.duration, self.output_file_path)
+        except Exception as e:
+            logger.error('{}: recording failed: {}'.format(self.name, e))
+            self.error = e
+        finally:
+            self.completed.set()
+
+    def poll(self):
+        """ Exit status once recording has finished (0, or 1 on error), None while it is still running"""
+        if not self.completed.is_set():
+            return None
+        return 1 if self.error is not None else 0
+
+    def wait(self, timeout=None):
+        """
+        Block until recording finishes (cf. IntelPowerGadget.wait)
+
+        :param timeout: float. Seconds. None waits indefinitely
+        :return: str. Output file path
+        """
+        if not self.completed.wait(timeout):
+            raise RuntimeError('{}: still recording after {} sec'.format(self.name, timeout))
+        if self.error is not None:
+            raise self.error
+        return self.output_file_path
+
+    def run(self, duration, output_file_path=None):
+        output_file_path = output_file_path or self.get_output_file_path()
+        logger.info('{}: recording RAPL energy to {}'.format(self.name, output_file_path))
+        interval = self.sampling_rate / 1000.0
+        with open(output_file_path, 'w') as f:
+            writer = csv.writer(f, quoting=csv.QUOTE_NONNUMERIC, lineterminator='\n')
+            writer.writerow(self.get_header())
+            # prime the counters so the first row's power covers a full interval
+            psutil.cpu_percent(interval=None)
+            for zone in self.zones:
+                zone.reset()
+                zone.update()
+            start = last = monotonic()
+            # half an interval of slack so the row at exactly `duration` is still written
+            for tick in DeadlineScheduler(interval, duration + interval / 2.0):
+                if not tick:
+                    continue
+                now = monotonic()
+                writer.writerow(self.get_row(now - start, now - last))
+                f.flush()
+                last = now
+            elapsed = monotonic() - start
+            f.write('\n')
+            for line in self.get_footer(elapsed):
+                f.write('"{}"\n'.format(line))
+
+    def close(self):
+        for zone in self.zones:
+            zone.close()
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+from mixins import NameMixin
+
+
+class ColumnarSampleStore(NameMixin):
+    """
+    Fixed-schema numeric samples in preallocated, growable arrays: a float64 block with one column per field, plus an
+    int64 timestamp column. One machine word per value, and no per-sample Python objects are kept.
+    """
+
+    def __init__(self, fields, capacity=1024):
+        """
+        :param fields: list of str. Column names, in the order values are appended
+        :param capacity: int. Initial number of rows; doubles whenever full
+        """
+        self.fields = list(fields)
+        self.num_rows = 0
+        self.timestamps = np.empty(capacity, dtype=np.int64)
+        self.values = np.empty((capacity, len(self.fields)), dtype=np.float64)
+
+    @property
+    def capacity(self):
+        return len(self.timestamps)
+
+    def grow(self):
+        capacity = 2 * self.capacity
+        timestamps = np.empty(capacity, dtype=np.int64)
+        timestamps[:self.num_rows] = self.timestamps[:self.num_rows]
+        values = np.empty((capacity, len(self.fields)), dtype=np.float64)
+        values[:self.num_rows] = self.values[:self.num_rows]
+        self.timestamps, self.values = timestamps, values
+
+    def append(self, timestamp_ns, values):
+        """
+        :param timestamp_ns: int
+        :param values: sequence of numbers (None is stored as NaN), one per field
+        """
+        if self.num_rows == self.capacity:
+            self.grow()
+        self.timestamps[self.num_rows] = timestamp_ns
+        self.values[self.num_rows] = [np.nan if value is None else value for value in values]
+        self.num_rows += 1
+
+    def to_dataframe(self):
+        df = pd.DataFrame(self.values[:self.num_rows], columns=self.fields)
+        df.insert(0, 'timestamp_ns', self.timestamps[:self.num_rows])
+        return df
+
+    def __len__(self):
+        return self.num_rows
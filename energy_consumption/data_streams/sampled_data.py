@@ -1,7 +1,7 @@
 import abc
 import json
+import os
 import threading
-import time
 from datetime import datetime
 from os import path
 
@@ -10,7 +10,10 @@ import logging
 
 from marionette_driver.marionette import Marionette
 
-from energy_consumption.helpers.io_helpers import read_txt_file
+from energy_consumption.helpers.io_helpers import read_txt_file, JsonLinesWriter
+from energy_consumption.data_streams.sample_store import ColumnarSampleStore
+from energy_consumption.helpers.time_helpers import DeadlineScheduler, monotonic, monotonic_ns, thread_time, \
+    IS_THREAD_TIME_PER_THREAD
 from mixins import NameMixin
 
 logger = logging.getLogger(__name__)
@@ -22,12 +25,97 @@ def get_now():
     return datetime.now().strftime(TIMESTAMP_FMT)
 
 
+def get_clock_anchor():
+    """
+    Pairs the wall clock with the monotonic clock. Samples are stamped with `timestamp_ns` (int, monotonic_ns) only;
+    one anchor per experiment maps them back to wall-clock time.
+    """
+    return {'timestamp': get_now(), 'timestamp_ns': monotonic_ns()}
+
+
+def apply_counter_delta(tabs, delta):
+    """
+    Applies a delta-encoded performance counter snapshot (see retrieve_performance_counter_deltas.js) to the previous
+    full tabs map. Returns a new map; unchanged tabs are shared with `tabs`, which is not modified.
+    """
+    if delta['keyframe']:
+        return delta['tabs']
+    full = dict(tabs)
+    for tab_id in delta['removed']:
+        full.pop(tab_id, None)
+    for tab_id, tab_delta in delta['tabs'].items():
+        prev_children = full[tab_id]['children'] if tab_id in full else []
+        removed_children = set(tab_delta.get('removedChildren', ()))
+        changed = {child['counterId']: child for child in tab_delta['children']}
+        children = [changed.pop(child['counterId'], child) for child in prev_children
+                    if child['counterId'] not in removed_children]
+        children.extend(child for child in tab_delta['children'] if child['counterId'] in changed)
+        tab = {key: value for key, value in tab_delta.items() if key != 'removedChildren'}
+        tab['children'] = children
+        full[tab_id] = tab
+    return full
+
+
+def iter_full_snapshots(samples):
+    """
+    Lazily rebuilds full performance counter samples from a mix of delta-encoded and full samples.
+
+    :param samples: iterable of sample dicts, as written by a PerformanceCounterRetriever
+    :return: generator of sample dicts with full `tabs`
+    """
+    tabs = None
+    for sample in samples:
+        snapshot = sample.get('tabs', {})
+        if 'keyframe' not in snapshot:
+            yield sample
+            continue
+        if tabs is None and not snapshot['keyframe']:
+            logger.warning('Skipping counter delta at {}: no preceding keyframe'.format(sample.get('timestamp_ns')))
+            continue
+        tabs = apply_counter_delta(tabs, snapshot)
+        full_sample = dict(sample)
+        full_sample['tabs'] = {'tabs': tabs, 'date': snapshot['date']}
+        yield full_sample
+
+
 class SampledDataRetriever(NameMixin):
     __metaclass__ = abc.ABCMeta
-
-    def __init__(self, interval=1):
+    # whether prepare needs Firefox up and running
+    NEEDS_BROWSER = False
+
+    def __init__(self, interval=1, **kwargs):
+        """
+        :param interval: float. Seconds between samples
+        :param kwargs:
+            stream: bool. Default True. Append samples to a .jsonl file as they arrive instead of holding them in
+                memory until the end of the run
+            fsync_interval: float. Default 10. Max seconds between fsyncs of the streamed file
+            burst_interval: float. Default None (no bursts). Seconds between samples for `burst_window` seconds after
+                a navigating Task starts
+            burst_window: float. Default 30
+            idle_interval: float. Default `interval`. Seconds between samples outside of bursts
+        """
         self.samples = []
         self.interval = interval
+        self.scheduler = None
+        self.burst_interval = kwargs.get('burst_interval', None)
+        self.burst_window = kwargs.get('burst_window', 30)
+        self.idle_interval = kwargs.get('idle_interval', interval)
+        self.burst_until = None
+        self.stream = kwargs.get('stream', True)
+        self.fsync_interval = kwargs.get('fsync_interval', 10)
+        self.writer = None
+        self.dir_path = None
+        self.thread = None
+        # held while sampling and while rotating, so no sample is written half into the old directory
+        self._output_lock = threading.Lock()
+        self._stopped = threading.Event()
+        # called with each sample as it is written, e.g. to watch the stream live
+        self.sample_listeners = []
+        # cumulative cost of sampling, i.e. the harness's own observer effect
+        self.num_samples = 0
+        self.sample_wall_time = 0.0
+        self.sample_cpu_time = 0.0
 
     @abc.abstractproperty
     def message(self):
@@ -43,41 +131,229 @@ class SampledDataRetriever(NameMixin):
     def get_sample(self, **kwargs):
         return
 
-    def run(self, duration, dir_path):
-        thread = threading.Thread(target=self.collect, args=(duration, dir_path))
-        thread.daemon = True
-        thread.start()
+    def prepare(self):
+        """ One-off setup done ahead of sampling (e.g., connecting, installing in-browser state), so the first tick is
+        not delayed by it"""
+        pass
+
+    def run(self, duration, dir_path, start=None):
+        """
+        :param duration: float. Seconds to sample for. None samples until stop is called
+        :param dir_path: str. Output directory
+        :param start: float. monotonic() time of the first sample, e.g. an experiment-wide t0. Default now
+        """
+        # output is set up before returning, so a rotate straight after cannot race the sampling thread
+        self.open_output(dir_path)
+        self.thread = threading.Thread(target=self.collect, args=(duration, None, start))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """ End sampling before `duration` is up (or at all, for duration None): the samples are then dumped as usual"""
+        self._stopped.set()
+        if self.scheduler is not None:
+            self.scheduler.stop()
+
+    def join(self, timeout=None):
+        """
+        Wait for the sampling thread started by run to have dumped its samples
+
+        :return: bool. Whether it has finished
+        """
+        if self.thread is not None:
+            self.thread.join(timeout)
+            return not self.thread.is_alive()
+        return True
 
-    def collect(self, duration=None, dir_path=None):
-        start = time.time()
-        while duration is None or time.time() < start + duration:
+    @property
+    def output_file_names(self):
+        """ Files a run leaves in its output directory"""
+        return [self.stream_file_name if self.stream else self.file_name]
+
+    def missing_output(self):
+        """ Output files of the last run that are missing or still being written: any means the output is incomplete"""
+        if self.dir_path is None:
+            return []
+        missing = [file_name for file_name in self.output_file_names
+                   if not path.isfile(path.join(self.dir_path, file_name))]
+        if self.writer is not None and not self.writer.closed:
+            missing.append(self.stream_file_name)
+        return missing
+
+    @property
+    def stream_file_name(self):
+        """ Serialization file name when streaming samples to disk"""
+        return path.splitext(self.file_name)[0] + JsonLinesWriter.FILE_EXT
+
+    @property
+    def schedule_file_name(self):
+        """ Serialization file name of the sampling schedule report (missed ticks, overruns)"""
+        return '{}_schedule.json'.format(path.splitext(self.file_name)[0])
+
+    @property
+    def current_interval(self):
+        """ Seconds between samples right now: `burst_interval` within a burst window, `idle_interval` otherwise"""
+        if self.burst_until is not None and monotonic() < self.burst_until:
+            return self.burst_interval
+        return self.idle_interval
+
+    def notify_task(self, task):
+        """ Called as each Task starts: a navigation opens a burst window of fast sampling"""
+        if self.burst_interval is None or not task.triggers_burst:
+            return
+        logger.debug('{}: bursting to {} sec for {} sec'.format(self.name, self.burst_interval, self.burst_window))
+        self.burst_until = monotonic() + self.burst_window
+        self.update_interval()
+
+    def update_interval(self):
+        if self.scheduler is not None:
+            self.scheduler.set_interval(self.current_interval)
+
+    def collect(self, duration=None, dir_path=None, start=None):
+        """
+        :param duration: float. Seconds to sample for. None samples until stop is called
+        :param dir_path: str. Output directory, unless already set up by run
+        :param start: float. monotonic() time of the first sample. Default now
+        """
+        if dir_path is not None:
+            self.open_output(dir_path)
+        # deadline-based: sampling latency does not stretch the period, overruns are reported instead
+        self.scheduler = DeadlineScheduler(self.current_interval, duration, start=start)
+        for _ in self.scheduler:
+            if self._stopped.is_set():
+                break
             logger.debug(self.message)
-            self.append_sample()
-            time.sleep(self.interval)
+            self.timed_append_sample()
+            self.update_interval()
+        self.stop_sampling()
 
         logger.debug("Dumping counters")
-        self.dump_counters(dir_path)
+        # wherever the last rotate pointed the output
+        self.dump_counters(self.dir_path)
+        self.dump_schedule(self.dir_path)
+
+    def open_output(self, dir_path):
+        self.dir_path = dir_path
+        if self.stream and dir_path is not None:
+            self.open_writer(dir_path)
+
+    def rotate(self, dir_path):
+        """
+        Carry on sampling into `dir_path`: what has been sampled so far is dumped to the current directory first, as at
+        the end of a run. Lets one sampling run span several experiments (see Campaign).
+        """
+        with self._output_lock:
+            if self.dir_path is not None:
+                self.dump_counters(self.dir_path)
+            self.reset_samples()
+            self.open_output(dir_path)
+
+    def reset_samples(self):
+        """ Start afresh after a rotate"""
+        self.samples = []
+
+    def dump_schedule(self, dir_path):
+        stats = self.scheduler.stats
+        logger.info('{}: {} missed ticks over {} overruns (max lateness {:.3f} sec)'.format(
+            self.name, stats['missed_ticks'], stats['num_overruns'], stats['max_lateness']))
+        with open(path.join(dir_path, self.schedule_file_name), 'w') as f:
+            json.dump(stats, f, indent=4, sort_keys=True)
+
+    def open_writer(self, dir_path):
+        self.writer = JsonLinesWriter(path.join(dir_path, self.stream_file_name), fsync_interval=self.fsync_interval)
+        # anything sampled before streaming began (e.g., a schema record) goes out first
+        for sample in self.samples:
+            self.writer.write(sample)
+        del self.samples[:]
+
+    def use_session(self, session):
+        """ Hand the retriever a SharedMarionette session. Only Marionette-based retrievers make use of it"""
+        pass
+
+    def stop_sampling(self):
+        """ Called once the sampling loop has finished, before the samples are dumped"""
+        pass
+
+    def timed_append_sample(self, **kwargs):
+        """ append_sample, accumulating the wall and CPU time it costs"""
+        wall_start, cpu_start = monotonic(), thread_time()
+        try:
+            with self._output_lock:
+                self.append_sample(**kwargs)
+        finally:
+            self.sample_cpu_time += thread_time() - cpu_start
+            self.sample_wall_time += monotonic() - wall_start
+            self.num_samples += 1
+
+    @property
+    def overhead(self):
+        """ Without a per-thread CPU clock the CPU time also counts every other thread running meanwhile: it is then
+        reported as process_cpu_time instead of cpu_time"""
+        return {'num_samples': self.num_samples, 'wall_time': self.sample_wall_time,
+                'cpu_time' if IS_THREAD_TIME_PER_THREAD else 'process_cpu_time': self.sample_cpu_time}
 
     def append_sample(self, **kwargs):
-        self.samples.append(self.get_sample(**kwargs))
+        self.write_sample(self.get_sample(**kwargs))
+
+    def add_sample_listener(self, listener):
+        self.sample_listeners.append(listener)
+
+    def remove_sample_listener(self, listener):
+        self.sample_listeners.remove(listener)
+
+    def write_sample(self, sample):
+        if self.writer is not None:
+            self.writer.write(sample)
+        else:
+            self.samples.append(sample)
+        self.notify_sample_listeners(sample)
+
+    def notify_sample_listeners(self, sample):
+        for listener in self.sample_listeners:
+            try:
+                listener(sample)
+            except Exception as e:
+                logger.error('{}: sample listener failed: {}'.format(self.name, e))
 
     def dump_counters(self, dir_path):
+        if self.writer is not None:
+            # streamed samples are already on disk: just make them durable
+            self.writer.close()
+            return
         file_path = path.join(dir_path, self.file_name)
         with open(file_path, 'w') as f:
             json.dump(self.samples, f, indent=4, sort_keys=True)
 
 
 class PsutilDataRetriever(SampledDataRetriever):
-    """Note: 1st element of counters will be the schema of which measures
-    come from which psutil method calls. e.g., `syscalls` and `interrupts`
-    come from `psutil.cpu_stats`.
+    """By default (columnar=True) samples go to a ColumnarSampleStore and are dumped as CSV, with the schema of which
+    measures come from which psutil method calls (e.g., `syscalls` and `interrupts` come from `psutil.cpu_stats`)
+    alongside as JSON.
+
+    Note: with columnar=False, 1st element of counters will be the schema.
     """
 
-    def __init__(self, interval=1, method_names=('cpu_stats', 'cpu_times', 'sensors_battery')):
-        super(PsutilDataRetriever, self).__init__(interval=interval)
+    def __init__(self, interval=1, method_names=('cpu_stats', 'cpu_times', 'sensors_battery'), **kwargs):
+        super(PsutilDataRetriever, self).__init__(interval=interval, **kwargs)
         logger.debug("{}: instantiating".format(self.name))
         self.method_names = method_names
-        self.samples.append(self.gen_cpu_stat_names(method_names=method_names))
+        self.schema = self.gen_cpu_stat_fields(method_names=method_names)
+        self.columnar = kwargs.get('columnar', True)
+        self.store = None
+        if self.columnar:
+            if kwargs.get('stream', False):
+                if 'columnar' in kwargs:
+                    raise ValueError('{}: columnar output cannot be streamed: pass one of columnar and stream'.format(
+                        self.name))
+                logger.warning('{}: columnar output (the default) is not streamed: pass columnar=False to stream '
+                               'samples'.format(self.name))
+            # fixed-width rows are compact in memory already: no need to stream them
+            self.stream = False
+            self.store = ColumnarSampleStore([field for field, _ in self.schema])
+            self.method_num_fields = [(method_name, sum(1 for _, name in self.schema if name == method_name))
+                                      for method_name in method_names]
+        else:
+            self.samples.append(dict(self.schema))
 
     @property
     def message(self):
@@ -87,32 +363,124 @@ class PsutilDataRetriever(SampledDataRetriever):
     def file_name(self):
         return 'psutil_sampled_data.json'
 
+    @property
+    def columnar_file_name(self):
+        return 'psutil_sampled_data.csv'
+
+    @property
+    def output_file_names(self):
+        if not self.columnar:
+            return super(PsutilDataRetriever, self).output_file_names
+        return [self.columnar_file_name, self.schema_file_name]
+
+    @property
+    def schema_file_name(self):
+        return 'psutil_sampled_data_schema.json'
+
     @staticmethod
-    def gen_cpu_stat_names(method_names=('cpu_stats', 'cpu_times')):
-        dct = {}
+    def gen_cpu_stat_fields(method_names=('cpu_stats', 'cpu_times')):
+        """ Ordered (field, method_name) pairs. Methods returning None (e.g., sensors_battery without a battery) are
+        left out."""
+        fields = []
         for method_name in method_names:
             method = getattr(psutil, method_name)
             res = method()
-            dct.update({field: method_name for field in res._fields})
-        return dct
+            if res is None:
+                logger.warning('psutil.{} returned nothing: not sampling it'.format(method_name))
+                continue
+            fields.extend((field, method_name) for field in res._fields)
+        return fields
+
+    @staticmethod
+    def gen_cpu_stat_names(method_names=('cpu_stats', 'cpu_times')):
+        return dict(PsutilDataRetriever.gen_cpu_stat_fields(method_names=method_names))
 
     def get_sample(self, **_):
-        counters = {'timestamp': get_now()}
+        counters = {'timestamp_ns': monotonic_ns()}
         for method_name in self.method_names:
             method = getattr(psutil, method_name)
             res = method()  # NamedTuples
-            counters.update(dict(zip(res._fields, res)))
+            if res is not None:
+                counters.update(dict(zip(res._fields, res)))
         return counters
 
+    def append_sample(self, **kwargs):
+        if not self.columnar:
+            return super(PsutilDataRetriever, self).append_sample(**kwargs)
+        timestamp_ns = monotonic_ns()
+        values = []
+        for method_name, num_fields in self.method_num_fields:
+            if not num_fields:
+                continue
+            res = getattr(psutil, method_name)()
+            values.extend(res if res is not None else (None,) * num_fields)
+        self.store.append(timestamp_ns, values)
+        if self.sample_listeners:
+            # only built for listeners: the store itself keeps no per-sample dict
+            sample = dict(zip(self.store.fields, values))
+            sample['timestamp_ns'] = timestamp_ns
+            self.notify_sample_listeners(sample)
+
+    def reset_samples(self):
+        if not self.columnar:
+            self.samples = [dict(self.schema)]
+            return
+        self.store = ColumnarSampleStore([field for field, _ in self.schema])
+
+    def dump_counters(self, dir_path):
+        if not self.columnar:
+            return super(PsutilDataRetriever, self).dump_counters(dir_path)
+        self.store.to_dataframe().to_csv(path.join(dir_path, self.columnar_file_name), index=False)
+        with open(path.join(dir_path, self.schema_file_name), 'w') as f:
+            json.dump(dict(self.schema), f, indent=4, sort_keys=True)
+
+
+class HarnessOverheadRetriever(SampledDataRetriever):
+    """
+    Samples the harness's own cost: CPU time, threads and memory of this Python process, plus the cumulative
+    wall and CPU time each retriever has spent sampling. All values are cumulative; difference them per interval.
+    """
+
+    def __init__(self, sampled_data_retrievers, interval=1, **kwargs):
+        super(HarnessOverheadRetriever, self).__init__(interval=interval, **kwargs)
+        logger.debug("{}: instantiating".format(self.name))
+        self.sampled_data_retrievers = tuple(sampled_data_retrievers) + (self,)
+        self.process = psutil.Process(os.getpid())
+
+    @property
+    def message(self):
+        return '{}: sampling harness overhead'.format(self.name)
+
+    @property
+    def file_name(self):
+        return 'harness_overhead_sampled_data.json'
+
+    def get_sample(self, **_):
+        with self.process.oneshot():
+            cpu_times = self.process.cpu_times()
+            process = {'pid': self.process.pid, 'user': cpu_times.user, 'system': cpu_times.system,
+                       'num_threads': self.process.num_threads(), 'rss': self.process.memory_info().rss}
+        return {'timestamp_ns': monotonic_ns(), 'process': process,
+                'retrievers': {retriever.name: retriever.overhead for retriever in self.sampled_data_retrievers}}
+
 
 class PerformanceCounterRetriever(SampledDataRetriever):
+    NEEDS_BROWSER = True
     JS_DIR_PATH = path.join(path.dirname(__file__), 'js')
-
-    def __init__(self, interval=1):
+    JS_LIB_FILE_NAMES = ('performance_counters.js',)
+
+    def __init__(self, interval=1, **kwargs):
+        """
+        :param interval: float. Seconds between samples
+        :param kwargs:
+            marionette_port: int. Default 2828. Port to connect on when not given a shared session
+        """
         logger.debug("{}: instantiating".format(self.name))
         self._client = None
-        self.perf_getter_script = read_txt_file(path.join(self.JS_DIR_PATH, 'retrieve_performance_counters.js'))
-        super(PerformanceCounterRetriever, self).__init__(interval=interval)
+        self.session = None
+        self.marionette_port = kwargs.get('marionette_port', 2828)
+        self.perf_getter_script = self.read_script('retrieve_performance_counters.js')
+        super(PerformanceCounterRetriever, self).__init__(interval=interval, **kwargs)
 
     @property
     def client(self):
@@ -131,25 +499,152 @@ class PerformanceCounterRetriever(SampledDataRetriever):
 
     def start_client(self):
         logger.info('{}: connecting to Marionette and beginning session'.format(self.name))
-        client = Marionette('localhost', port=2828)
+        client = Marionette('localhost', port=self.marionette_port)
         client.start_session()
         return client
 
-    def get_sample(self, **kwargs):
+    def use_session(self, session):
+        self.session = session
+
+    def prepare(self):
+        # without a shared session, open our own now rather than on the first tick
+        if self.session is None:
+            _ = self.client
+
+    def execute_chrome_script(self, script, script_args=()):
+        """ Run `script` in chrome context, on the shared session if there is one, else on an own client"""
+        if self.session is not None:
+            with self.session.request(self.name, priority=True) as client:
+                with client.using_context(client.CONTEXT_CHROME):
+                    return client.execute_script(script, script_args=script_args)
         with self.client.using_context(self.client.CONTEXT_CHROME):
-            counters = {'tabs': self.client.execute_script(self.perf_getter_script),
-                        'timestamp': get_now()}
+            return self.client.execute_script(script, script_args=script_args)
+
+    @classmethod
+    def read_script(cls, file_name):
+        """ Chrome-context script with the shared JS library functions prepended"""
+        libs = [read_txt_file(path.join(cls.JS_DIR_PATH, 'lib', lib_file_name))
+                for lib_file_name in cls.JS_LIB_FILE_NAMES]
+        return '\n'.join(libs + [read_txt_file(path.join(cls.JS_DIR_PATH, file_name))])
+
+    def get_sample(self, **kwargs):
+        counters = {'tabs': self.execute_chrome_script(self.perf_getter_script),
+                    'timestamp_ns': monotonic_ns()}
         return counters
 
 
+class BufferedPerformanceCounterRetriever(PerformanceCounterRetriever):
+    """
+    High-frequency performance counters: a timer inside Firefox snapshots the counters every `resolution` ms into a
+    buffer, which is drained over Marionette in one batch every `interval` seconds. Match `resolution` to the
+    Intel Power Gadget sampling rate to line the streams up.
+    """
+
+    def __init__(self, interval=5, resolution=100, **kwargs):
+        """
+        :param interval: float. Seconds between buffer drains
+        :param resolution: int. Milliseconds between in-browser counter snapshots
+        :param kwargs:
+            max_buffer_size: int. Default 10 drains worth of snapshots. Oldest snapshots are dropped beyond this
+        """
+        super(BufferedPerformanceCounterRetriever, self).__init__(interval=interval, **kwargs)
+        self.resolution = resolution
+        self.max_buffer_size = kwargs.get('max_buffer_size', int(10 * 1000 * interval / resolution))
+        self.buffer_script = self.read_script('performance_counter_buffer.js')
+        self.buffer_installed = False
+
+    @property
+    def message(self):
+        return '{}: draining buffered performance counters'.format(self.name)
+
+    @property
+    def file_name(self):
+        return 'ff_perf_counter_buffered_sampled_data.json'
+
+    def execute_buffer_action(self, action):
+        batch = self.execute_chrome_script(self.buffer_script,
+                                           script_args=(action, self.resolution, self.max_buffer_size))
+        # Cu.now() is ms on the browser's clock: place each snapshot relative to the time of the drain
+        now_ns = monotonic_ns()
+        if batch['dropped'] or batch['skipped']:
+            logger.warning('{}: buffer dropped {} and skipped {} snapshot(s) since last drain'.format(
+                self.name, batch['dropped'], batch['skipped']))
+        samples = []
+        for snapshot in batch['samples']:
+            timestamp_ns = now_ns - int((batch['date'] - snapshot['date']) * 1e6)
+            samples.append({'tabs': snapshot, 'timestamp_ns': timestamp_ns})
+        return samples
+
+    def prepare(self):
+        super(BufferedPerformanceCounterRetriever, self).prepare()
+        self.install_buffer()
+
+    def install_buffer(self):
+        logger.info('{}: installing counter buffer at {} ms resolution'.format(self.name, self.resolution))
+        self.execute_buffer_action('install')
+        self.buffer_installed = True
+
+    def get_sample(self, **kwargs):
+        """ Returns the list of snapshots buffered since the last drain"""
+        if not self.buffer_installed:
+            self.install_buffer()
+            return []
+        return self.execute_buffer_action('drain')
+
+    def append_sample(self, **kwargs):
+        for sample in self.get_sample(**kwargs):
+            self.write_sample(sample)
+
+    def stop_sampling(self):
+        if self.buffer_installed:
+            for sample in self.execute_buffer_action('uninstall'):
+                self.write_sample(sample)
+            self.buffer_installed = False
+
+
+class DeltaPerformanceCounterRetriever(PerformanceCounterRetriever):
+    """
+    Performance counters delta-encoded in the browser: only tabs and children that changed since the last sample are
+    serialized, with a full keyframe every `keyframe_interval` samples. Rebuild with iter_full_snapshots.
+    """
+
+    def __init__(self, interval=1, keyframe_interval=60, **kwargs):
+        super(DeltaPerformanceCounterRetriever, self).__init__(interval=interval, **kwargs)
+        self.keyframe_interval = keyframe_interval
+        self.delta_getter_script = self.read_script('retrieve_performance_counter_deltas.js')
+        # first sample is always a keyframe, whatever state an earlier retriever left in the browser
+        self.reset = True
+
+    @property
+    def message(self):
+        return '{}: sampling delta-encoded performance counters'.format(self.name)
+
+    @property
+    def file_name(self):
+        return 'ff_perf_counter_delta_sampled_data.json'
+
+    def get_sample(self, **kwargs):
+        counters = {'tabs': self.execute_chrome_script(self.delta_getter_script,
+                                                       script_args=(self.keyframe_interval, self.reset)),
+                    'timestamp_ns': monotonic_ns()}
+        self.reset = False
+        return counters
+
+    def reset_samples(self):
+        super(DeltaPerformanceCounterRetriever, self).reset_samples()
+        # every file starts with a keyframe so it can be rebuilt on its own
+        self.reset = True
+
+
 class PerformanceProcessesRetriever(PerformanceCounterRetriever):
     """
     Anything Marionette based needs to be merged into single class due to sampling issues.
     """
 
-    def __init__(self, interval=1):
-        super(PerformanceProcessesRetriever, self).__init__(interval=interval)
-        self.process_getter_script = read_txt_file(path.join(self.JS_DIR_PATH, 'retrieve_process_info.js'))
+    def __init__(self, interval=1, **kwargs):
+        super(PerformanceProcessesRetriever, self).__init__(interval=interval, **kwargs)
+        # counters and process info fused into one script: one Marionette round-trip, one timestamp
+        self.perf_process_getter_script = self.read_script('retrieve_performance_processes.js')
 
     @property
     def message(self):
@@ -160,9 +655,8 @@ class PerformanceProcessesRetriever(PerformanceCounterRetriever):
         return 'ff_performance_processes_sampled_data.json'
 
     def get_sample(self, **kwargs):
-        counters = super(PerformanceProcessesRetriever, self).get_sample(**kwargs)
-        with self.client.using_context(self.client.CONTEXT_CHROME):
-            counters.update({'processes': self.client.execute_script(self.process_getter_script)})
+        counters = self.execute_chrome_script(self.perf_process_getter_script)
+        counters['timestamp_ns'] = monotonic_ns()
         return counters
 
 # class WindowsBatteryReportRetriever(SampledDataRetriever):
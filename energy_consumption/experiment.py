@@ -7,16 +7,54 @@ import time
 import traceback
 from os import path, getcwd
 
+import pandas as pd
 from marionette_driver.marionette import Marionette
 
 from energy_consumption.helpers.io_helpers import make_dir
+from energy_consumption.marionette_session import SharedMarionette
+from energy_consumption.startup import StartupPipeline
 from mixins import NameMixin
-from energy_consumption.data_streams.intel_power_gadget import IntelPowerGadget, read_ipg
-from energy_consumption.data_streams.sampled_data import PerformanceCounterRetriever, get_now
+from energy_consumption.data_streams.collector import SampledDataCollector
+from energy_consumption.data_streams.intel_power_gadget import IntelPowerGadget, IpgTailReader, read_ipg, \
+    stitch_ipg_segments, get_ipg_dtypes
+from energy_consumption.data_streams.rapl import RaplPowerGadget
+from energy_consumption.data_streams.sampled_data import PerformanceCounterRetriever, HarnessOverheadRetriever, \
+    get_now, get_clock_anchor
+from energy_consumption.helpers.time_helpers import monotonic, monotonic_ns
 
 logger = logging.getLogger(__name__)
 
 
+def get_ff_default_path():
+    platform = sys.platform.lower()
+    if platform == 'darwin':
+        ff_exe_path = '/Applications/Firefox Nightly.app/Contents/MacOS/firefox'
+    elif platform == 'win32':
+        ff_exe_path = 'C:/Program Files/Firefox Nightly/firefox.exe'
+    elif platform.startswith('linux'):
+        ff_exe_path = '/usr/bin/firefox'
+    else:
+        raise ValueError('{} platform currently not supported'.format(platform))
+    return ff_exe_path
+
+
+def start_client(share_session=True, **kwargs):
+    """
+    Launch Firefox under Marionette and start a session, ready for a SharedMarionette if share_session
+
+    Kwargs:
+        marionette_port: int. Default 2828. Distinct ports let several instances run side by side
+        headless: bool. Default False
+        profile: str or mozprofile.Profile. Profile directory, copied by Marionette before use, or a Profile, used in
+            place (see ProfileManager). Default a fresh temporary profile
+    """
+    client = Marionette('localhost', port=kwargs.get('marionette_port', 2828), bin=get_ff_default_path(),
+                        prefs={"browser.tabs.remote.autostart": True},
+                        gecko_log='-', headless=kwargs.get('headless', False), profile=kwargs.get('profile', None))
+    client.start_session(capabilities=SharedMarionette.PAGE_LOAD_CAPABILITIES if share_session else None)
+    return client
+
+
 class ExperimentMeta(NameMixin):
     def __init__(self, exp_id, exp_name, **kwargs):
         self.exp_id = exp_id
@@ -44,6 +82,10 @@ class ExperimentMeta(NameMixin):
     def experiment_file_path(self):
         return path.join(self.exp_dir_path, '{}_{}_experiment.json'.format(self.exp_name, self.exp_id))
 
+    @property
+    def clock_anchor_file_path(self):
+        return path.join(self.exp_dir_path, 'clock_anchor.json')
+
 
 class Experiment(ExperimentMeta):
     """
@@ -61,6 +103,23 @@ class Experiment(ExperimentMeta):
             sampled_data_retrievers: tuple. Contains various SampledDataRetriever
             Kwargs:
                 duration: int. Default 60. # of seconds for Intel Power Gadget (IPG) to run.
+                power_gadget_cls: class. Default IntelPowerGadget, or RaplPowerGadget on Linux. Records power usage
+                    into ipg_results_path. None records counters only.
+                measure_overhead: bool. Default True. Add a HarnessOverheadRetriever recording the CPU and wall time
+                    the harness itself spends sampling.
+                use_collector: bool. Default False. Sample all retrievers and supervise IPG from a single
+                    SampledDataCollector loop instead of one thread each.
+                share_session: bool. Default True. Tasks and Marionette-based retrievers share one SharedMarionette
+                    session instead of each retriever opening its own.
+                marionette_port: int. Default 2828. Port of Firefox's Marionette server
+                headless: bool. Default False. Run Firefox headless
+                profile: str. Firefox profile directory. Default a fresh temporary profile
+                profile_manager: ProfileManager. Default None. Launch Firefox on a fresh clone of its profile template
+                    (instead of `profile`), recording cold and warm launch times to profile.json.
+                ipg_callback: callable. Called with each power row (a dict keyed by the PowerLog header) as it is
+                    written, while the experiment runs.
+                ipg_segment_duration: float. Default None. Restart Intel Power Gadget every ipg_segment_duration
+                    seconds into separate segment files, stitched back together by clean_ipg_file.
             Return:
                 Experiment
         """
@@ -72,11 +131,27 @@ class Experiment(ExperimentMeta):
         # self.__ff_process = None
         self.__ff_exe_path = kwargs.get('ff_exe_path', self.get_ff_default_path())
         self.__ipg = None
+        self.ipg_reader = None
+        self.ipg_callback = kwargs.get('ipg_callback', None)
+        self.ipg_segment_duration = kwargs.get('ipg_segment_duration', None)
+        self.power_gadget_cls = kwargs.get('power_gadget_cls', RaplPowerGadget if sys.platform.startswith('linux')
+                                           else IntelPowerGadget)
         # ensure the experiment results directory exists and is cleaned out
         make_dir(self.exp_dir_path, clear=clear_exp_dir)
         self.duration = kwargs.get('duration', 60)
         self.start_time = None
         self.sampled_data_retrievers = sampled_data_retrievers or (PerformanceCounterRetriever(),)
+        if kwargs.get('measure_overhead', True):
+            self.sampled_data_retrievers = tuple(self.sampled_data_retrievers) + (
+                HarnessOverheadRetriever(self.sampled_data_retrievers),)
+        self.collector = None
+        if kwargs.get('use_collector', False):
+            self.collector = SampledDataCollector(self.sampled_data_retrievers)
+        self.share_session = kwargs.get('share_session', True)
+        self.client_kwargs = {'marionette_port': kwargs.get('marionette_port', 2828),
+                              'headless': kwargs.get('headless', False), 'profile': kwargs.get('profile', None)}
+        self.profile_manager = kwargs.get('profile_manager', None)
+        self.session = None
 
     @property
     def results(self):
@@ -94,46 +169,105 @@ class Experiment(ExperimentMeta):
     def ipg_results_path(self, _):
         raise AttributeError('{}: ipg_file_path cannot be manually set'.format(self.name))
 
+    @property
+    def session_stats_file_path(self):
+        return path.join(self.exp_dir_path, 'marionette_session_stats.json')
+
     def start_client(self):
         logger.info('{}: connecting to Marionette and beginning session'.format(self.name))
-        client = Marionette('localhost', port=2828, bin=self.get_ff_default_path(),
-                            prefs={"browser.tabs.remote.autostart": True},
-                            gecko_log='-')
-        client.start_session()
-        return client
+        return start_client(self.share_session, **self.client_kwargs)
+
+    def start_session(self, client):
+        """ Share `client` between the tasks and the sampled data retrievers"""
+        self.session = SharedMarionette(client)
+        for data_retriever in self.sampled_data_retrievers:
+            data_retriever.use_session(self.session)
+        return self.session.proxy(self.tasks.name)
 
     def get_ff_default_path(self):
-        platform = sys.platform.lower()
-        if platform == 'darwin':
-            ff_exe_path = '/Applications/Firefox Nightly.app/Contents/MacOS/firefox'
-        elif platform == 'win32':
-            ff_exe_path = 'C:/Program Files/Firefox Nightly/firefox.exe'
-        else:
-            raise ValueError('{}: {} platform currently not supported'.format(self.name, platform))
-        return ff_exe_path
+        return get_ff_default_path()
 
     def initialize(self, **kwargs):
+        """
+        Firefox, the sampled data streams and Intel Power Gadget are brought up concurrently, then all released at one
+        recorded t0 (see StartupPipeline).
+
+        Kwargs:
+            startup_timeout: float. Default 120. Seconds for all streams to be ready
+        """
         logger.debug('{}: initializing experiment'.format(self.name))
-        # Initialize client on tasks
-        self.tasks.client = self.start_client()
-        # connect to Firefox, begin collecting sampled data streams (e.g., performance counters, psutil)
-        self.start_sampling_data()
-        # fire up Intel Power Gadget
-        self.initialize_ipg(**kwargs)
+        pipeline = StartupPipeline(timeout=kwargs.get('startup_timeout', 120))
+        pipeline.add('Firefox', self.launch_browser, provides_browser=True)
+        if self.power_gadget_cls is not None:
+            pipeline.add(self.power_gadget_cls.__name__, self.prepare_ipg, self.start_ipg)
+        for data_retriever in self.sampled_data_retrievers:
+            release = None if self.collector is not None else self.get_sampling_release(data_retriever)
+            pipeline.add(data_retriever.name, data_retriever.prepare, release,
+                         needs_browser=data_retriever.NEEDS_BROWSER)
+        if self.collector is not None:
+            pipeline.add(self.collector.name, release=self.start_collector)
+        try:
+            t0_ns = pipeline.run()
+        finally:
+            with open(self.startup_file_path, 'w') as f:
+                json.dump(pipeline.report, f, indent=4, sort_keys=True)
+        # one wall-clock anchor for all the monotonic sample timestamps, taken at t0
+        self.write_clock_anchor(t0_ns)
         # log the experiment start
-        self.results.append({'timestamp': get_now(),
+        self.results.append({'timestamp': get_now(), 'timestamp_ns': t0_ns,
                              'action': '{}: Starting {}/{}'.format(self.name, self.exp_id, self.exp_name)})
 
-    def start_sampling_data(self):
-        for data_retriever in self.sampled_data_retrievers:
-            data_retriever.run(self.duration, self.exp_dir_path)
+    @property
+    def startup_file_path(self):
+        return path.join(self.exp_dir_path, 'startup.json')
+
+    @property
+    def profile_file_path(self):
+        return path.join(self.exp_dir_path, 'profile.json')
 
-    def initialize_ipg(self, **_):
+    def launch_browser(self):
+        if self.profile_manager is None:
+            client = self.start_client()
+        else:
+            self.client_kwargs['profile'] = self.profile_manager.clone()
+            start = monotonic()
+            client = self.start_client()
+            with open(self.profile_file_path, 'w') as f:
+                json.dump(self.profile_manager.report(self.client_kwargs['profile'], monotonic() - start), f,
+                          indent=4, sort_keys=True)
+        self.tasks.client = self.start_session(client) if self.share_session else client
+
+    def write_clock_anchor(self, t0_ns=None):
+        clock_anchor = get_clock_anchor()
+        clock_anchor['t0_ns'] = t0_ns
+        with open(self.clock_anchor_file_path, 'w') as f:
+            json.dump(clock_anchor, f, indent=4, sort_keys=True)
+
+    def get_sampling_release(self, data_retriever):
+        return lambda t0: data_retriever.run(self.duration, self.exp_dir_path, start=t0)
+
+    def start_collector(self, t0):
+        self.collector.run(self.duration, self.exp_dir_path, start=t0)
+
+    def prepare_ipg(self):
+        self.__ipg = self.power_gadget_cls(duration=self.duration, output_file_path=self.ipg_results_path,
+                                           segment_duration=self.ipg_segment_duration, threaded=False)
+
+    def start_ipg(self, _=None):
         logger.info('{}: Starting Intel Power Gadget to record for {}'.format(self.name, self.duration))
-        self.__ipg = IntelPowerGadget(duration=self.duration, output_file_path=self.ipg_results_path)
+        self.__ipg.start()
+        if self.collector is not None:
+            self.collector.supervise(self.__ipg)
+        # parse power rows as they are written rather than all at once at the end (one file only)
+        if not self.__ipg.segmented:
+            self.ipg_reader = IpgTailReader(self.__ipg.output_file_path, completed=self.__ipg.completed,
+                                            callback=self.ipg_callback).start()
         self.start_time = time.time()
 
     def run(self, **kwargs):
+        if 'wait_interval' in kwargs:
+            logger.warning('{}: wait_interval is ignored, the power gadget is waited on until it exits (see '
+                           'ipg_timeout)'.format(self.name))
         try:
             # begin experiment: start Firefox and logging performance counters
             self.initialize(**kwargs)
@@ -143,49 +277,126 @@ class Experiment(ExperimentMeta):
             self.finalize(**kwargs)
         except Exception as e:
             logger.error('{}: Experiment failed due to {}\n{}'.format(self.name, e, traceback.format_exc()))
-            with open(path.join(self.exp_dir_path, 'failure.alert')) as f:
+            with open(path.join(self.exp_dir_path, 'failure.alert'), 'w') as f:
                 f.write('Experimental data in this directory could be contaminated!\nUse at own risk!')
 
     def perform_experiment(self, **kwargs):
-        self.results.extend(self.tasks.run(**kwargs))
+        # retrievers hear about each task as it starts, e.g. to burst-sample after navigation
+        self.results.extend(self.tasks.run(task_listeners=self.sampled_data_retrievers, **kwargs))
 
     def serialize(self):
-        self.results.append({'timestamp': get_now(),
+        self.results.append({'timestamp': get_now(), 'timestamp_ns': monotonic_ns(),
                              'action': '{}: Ending {}/{}'.format(self.name, self.exp_id, self.exp_name)})
         with open(self.experiment_file_path, 'wb') as f:
             json.dump(self.results, f, indent=4, sort_keys=True)
 
-    def serialize_sampled_data(self):
-        for data_retriever in self.sampled_data_retrievers:
-            data_retriever.dump_counters(self.exp_dir_path)
+    @property
+    def shutdown_file_path(self):
+        return path.join(self.exp_dir_path, 'shutdown.json')
+
+    def stop_sampled_data(self, timeout):
+        """
+        Stops all the samplers at once, so they flush their output concurrently, then joins them and checks their
+        output is complete.
+
+        :param timeout: float. Seconds for all of them to finish
+        :return: dict. Per sampler: joined (bool), join_time (seconds) and missing (output file names)
+        """
+        samplers = [self.collector] if self.collector is not None else list(self.sampled_data_retrievers)
+        for sampler in samplers:
+            sampler.stop()
+        deadline = monotonic() + timeout
+        streams = {}
+        for sampler in samplers:
+            start = monotonic()
+            joined = sampler.join(max(0, deadline - monotonic()))
+            streams[sampler.name] = {'joined': joined, 'join_time': monotonic() - start,
+                                     'missing': sampler.missing_output()}
+        return streams
 
     def check_ipg_status(self, **kwargs):
-        wait_interval = kwargs.get('wait_interval', 60)
-        while (time.time() - self.start_time) < self.duration:
-            wait_time = self.duration - (time.time() - self.start_time)
-            logger.debug('{}: Waiting {} sec until Intel Power Gadget is complete'.format(self.name, wait_time))
-            time.sleep(wait_time)
-        while not glob.glob(path.join(self.ipg_results_path + '*')):
-            logger.info('{}: Waiting {} sec until Intel Power Gadget is found'.format(self.name, wait_interval))
-            time.sleep(wait_interval)
+        """
+        Wait for Intel Power Gadget to finish, returning as soon as it has exited with a complete file.
+
+        Kwargs:
+            ipg_timeout: float. Default 60. Seconds to wait beyond the experiment's duration before failing
+        """
+        if self.__ipg is None:
+            return
+        ipg_timeout = kwargs.get('ipg_timeout', 60)
+        wait_time = max(0, self.duration + ipg_timeout - (time.time() - self.start_time))
+        logger.debug('{}: Waiting up to {} sec until Intel Power Gadget is complete'.format(self.name, wait_time))
+        self.__ipg.wait(timeout=wait_time)
 
     def clean_ipg_file(self):
-        # FIXME: Broken !!!
-        logger.info('{}: Stripping Intel Power Gadget of funny end of file stuff.')
-        for ipg_file_path in glob.glob(path.join(self.ipg_results_path + '*')):
-            ipg = read_ipg(ipg_file_path)
+        if self.__ipg is None:
+            return
+        logger.info('{}: Stripping Intel Power Gadget of funny end of file stuff.'.format(self.name))
+        ipg_file_paths = [ipg_file_path for ipg_file_path in sorted(glob.glob(self.ipg_results_path + '*'))
+                          if ipg_file_path.endswith(self.__ipg.output_file_ext) and
+                          not ipg_file_path.endswith('clean.txt')]
+        if self.__ipg.segmented:
+            ipg, stitched_segments = stitch_ipg_segments([segment['file_path'] for segment in self.__ipg.segments
+                                                          if path.isfile(segment['file_path'])],
+                                                         self.__ipg.segments_file_path)
+            ipg.to_csv(self.ipg_results_path + '_stitched_clean.txt', index=False)
+            # record what stitching found (truncated or skipped segments, gaps) alongside the launch times
+            stitched_segments = dict((segment['file_path'], segment) for segment in stitched_segments)
+            for segment in self.__ipg.segments:
+                segment['stitched'] = stitched_segments.get(segment['file_path'])
+            self.__ipg.dump_segments()
+        for ipg_file_path in ipg_file_paths:
+            # rows already parsed by the tail reader need not be read again
+            if self.ipg_reader is not None and ipg_file_path == self.ipg_reader.file_path and \
+                    self.ipg_reader.wait(timeout=self.ipg_reader.poll_interval * 10) and self.ipg_reader.header:
+                ipg = pd.DataFrame(self.ipg_reader.rows, columns=self.ipg_reader.header).astype(
+                    get_ipg_dtypes(self.ipg_reader.header))
+            else:
+                try:
+                    ipg = read_ipg(ipg_file_path)
+                except (IOError, ValueError) as e:
+                    if not self.__ipg.segmented:
+                        raise
+                    # already accounted for in the stitched series
+                    logger.warning('{}: skipping unreadable segment {}: {}'.format(self.name, ipg_file_path, e))
+                    continue
             ipg_clean_file_path = ipg_file_path.replace(self.__ipg.output_file_ext, 'clean.txt')
             ipg.to_csv(ipg_clean_file_path, index=False)
 
     def finalize(self, **kwargs):
+        """
+        Teardown, in order: wait for Intel Power Gadget, stop the samplers and wait for them to flush, check all the
+        output is there, and only then quit Firefox. Raises if any sampled data is incomplete.
+
+        Kwargs:
+            shutdown_timeout: float. Default 30. Seconds for the samplers to stop and flush their output
+        """
+        start = monotonic()
         # save the experiment log
         self.serialize()
-        # wait to finish until Intel Power Gadget is done
-        self.check_ipg_status(**kwargs)
-        # strip the Intel Power Gadget file of summary garbage at end of txt file
-        self.clean_ipg_file()
-        # Stop Marionette and Firefox
-        self.tasks.client.quit(in_app=True)
+        try:
+            # wait to finish until Intel Power Gadget is done
+            self.check_ipg_status(**kwargs)
+            # strip the Intel Power Gadget file of summary garbage at end of txt file
+            self.clean_ipg_file()
+        finally:
+            # the samplers' streams end with the power gadget's: stop whatever is left of them
+            streams = self.stop_sampled_data(kwargs.get('shutdown_timeout', 30))
+            incomplete = dict((name, stream) for name, stream in streams.items()
+                              if not stream['joined'] or stream['missing'])
+            if self.session is not None:
+                with open(self.session_stats_file_path, 'w') as f:
+                    json.dump(self.session.stats, f, indent=4, sort_keys=True)
+            with open(self.shutdown_file_path, 'w') as f:
+                json.dump({'streams': streams, 'duration': monotonic() - start}, f, indent=4, sort_keys=True)
+            try:
+                # Stop Marionette and Firefox
+                self.tasks.client.quit(in_app=True)
+            finally:
+                if self.profile_manager is not None:
+                    self.profile_manager.remove(self.client_kwargs['profile'])
+        if incomplete:
+            raise RuntimeError('{}: sampled data incomplete: {}'.format(self.name, incomplete))
 
 
 class Tasks(NameMixin):
@@ -216,21 +427,86 @@ class Tasks(NameMixin):
         return
 
     def run(self, **kwargs):
+        """
+        Kwargs:
+            task_listeners: tuple. Objects with a notify_task(task) method, called as each task starts
+        """
+        task_listeners = kwargs.get('task_listeners', ())
         results = []
         for task in self.tasks:
+            for listener in task_listeners:
+                listener.notify_task(task)
             results.append(task.run(**kwargs))
         return results
 
 
+class TaskAction(object):
+    """
+    One action of a Task, validated and compiled once up front. Either a Python expression evaluated with `self` bound
+    to the Task (e.g., "self.client.navigate('http://mozilla.org')"), or structured as a tuple (method name, *args):
+    ('sleep', 60) sleeps, any other name calls that Marionette client method, e.g. ('navigate', 'http://mozilla.org').
+    """
+
+    def __init__(self, action):
+        if isinstance(action, basestring):
+            self.method_name, self.args = None, ()
+            self.source = action.strip()
+            self.code = compile(self.source, '<task>', 'eval')
+            return
+        self.method_name, self.args = action[0], tuple(action[1:])
+        if self.method_name == 'sleep':
+            self.source = 'time.sleep({})'.format(', '.join(repr(arg) for arg in self.args))
+        elif callable(getattr(Marionette, self.method_name, None)):
+            self.source = 'self.client.{}({})'.format(self.method_name, ', '.join(repr(arg) for arg in self.args))
+        else:
+            raise ValueError('{} is not a Marionette client method'.format(self.method_name))
+        self.code = None
+
+    def run(self, task, **kwargs):
+        if self.code is not None:
+            return eval(self.code, globals(), {'self': task, 'kwargs': kwargs})
+        if self.method_name == 'sleep':
+            return time.sleep(*self.args)
+        return getattr(task.client, self.method_name)(*self.args)
+
+
+def compile_task(task):
+    """
+    :param task: str of newline-separated expressions, a tuple (a single structured action), or a list of actions of
+        either form
+    :return: list of TaskAction
+    """
+    if isinstance(task, basestring):
+        actions = [line for line in task.split('\n') if line.strip()]
+    elif isinstance(task, tuple):
+        actions = [task]
+    else:
+        actions = task
+    return [TaskAction(action) for action in actions]
+
+
 class Task(NameMixin):
     """
-    A single Marionette task
+    A single Marionette task. Its actions are compiled when the task is created, so malformed ones fail before the
+    experiment starts; each is timed on the monotonic clock as it runs.
     """
+    NAVIGATION_ACTIONS = ('navigate', 'go_back', 'go_forward', 'refresh')
 
     def __init__(self, task, client, **kwargs):
-        self.__task = task
+        """
+            Args:
+            task: str, tuple or list. See compile_task
+            client: Marionette
+            Kwargs:
+                meta: dict. Logged alongside the task
+                burst: bool. Whether retrievers should burst-sample after this task starts. Default: whether the
+                    task navigates
+        """
+        self.__actions = compile_task(task)
+        self.__task = '\n'.join(action.source for action in self.__actions)
         self.__client = client
         self.__meta = kwargs.get('meta', {})
+        self.__burst = kwargs.get('burst', None)
 
     @property
     def client(self):
@@ -242,9 +518,8 @@ class Task(NameMixin):
 
     @property
     def task(self):
-        """ string of form:
-        url = 'http://mozilla.org'
-        self.client.navigate(url)
+        """ string of form (structured actions are rendered the same way):
+        self.client.navigate('http://mozilla.org')
         self.client.go_back()
         self.client.go_forward()
         """
@@ -254,18 +529,72 @@ class Task(NameMixin):
     def task(self, _):
         raise AttributeError('{}: task cannot be manually set'.format(self.name))
 
+    @property
+    def triggers_burst(self):
+        if self.__burst is not None:
+            return self.__burst
+        return any('client.{}('.format(action) in self.task for action in self.NAVIGATION_ACTIONS)
+
+    @property
+    def actions(self):
+        return self.__actions
+
+    def run_action(self, action, **kwargs):
+        return action.run(self, **kwargs)
+
     def run(self, **kwargs):
         # log the task time
-        result = {'timestamp': get_now(), 'action': self.task.replace('\n', '\t'), 'meta': self.meta}
+        result = {'timestamp': get_now(), 'timestamp_ns': monotonic_ns(), 'action': self.task.replace('\n', '\t'),
+                  'meta': self.meta, 'actions': []}
         try:
-            # fire off the task
-            for action in self.task.split('\n'):
-                eval(action)
+            # fire off the task, timing each action
+            for action in self.actions:
+                timing = {'action': action.source, 'start_ns': monotonic_ns()}
+                result['actions'].append(timing)
+                try:
+                    self.run_action(action, **kwargs)
+                finally:
+                    timing['end_ns'] = monotonic_ns()
+                    timing['duration'] = (timing['end_ns'] - timing['start_ns']) / 1e9
         except Exception as e:
             exp = traceback.format_exc()
             logger.error('{}: Failed on task\n{}\n{}'.format(self.name, e, exp))
             result['meta']['error'] = exp
             raise e
+        finally:
+            result['end_ns'] = monotonic_ns()
+            result['duration'] = (result['end_ns'] - result['timestamp_ns']) / 1e9
+        return result
+
+
+class SettleTask(Task):
+    """
+    Waits for the browser to settle instead of sleeping a fixed time: returns once the QuiescenceMonitor has seen no
+    activity for `window` seconds, or after `timeout` seconds at most. How long it took and the last observed activity
+    are logged in the task's meta under 'settle'.
+    """
+
+    def __init__(self, monitor, client, **kwargs):
+        """
+            Kwargs:
+                window: float. Default 5. Seconds activity must stay under the monitor's thresholds
+                timeout: float. Default 60
+                meta: dict. Logged alongside the task
+        """
+        self.monitor = monitor
+        self.window = kwargs.get('window', 5)
+        self.timeout = kwargs.get('timeout', 60)
+        super(SettleTask, self).__init__('settle(window={}, timeout={})'.format(self.window, self.timeout), client,
+                                         **kwargs)
+        self.__settle = None
+
+    def run_action(self, action, **kwargs):
+        # the single action is the settle(...) description: wait on the monitor instead of evaluating it
+        self.__settle = self.monitor.wait_for_quiescence(window=self.window, timeout=self.timeout)
+
+    def run(self, **kwargs):
+        result = super(SettleTask, self).run(**kwargs)
+        result['meta'] = dict(result['meta'], settle=self.__settle)
         return result
 
 # FIXME: Not supported under changes with battery consumption work. Needs lots of love to work!
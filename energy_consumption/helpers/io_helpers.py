@@ -1,11 +1,15 @@
 import cPickle
+import json
 import logging
+import os
 import psutil
 import sys
 import tempfile
+import threading
 from os import path, makedirs, listdir, remove
 
 from text_helpers import always_str
+from time_helpers import monotonic
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +25,71 @@ def write_txt_file(file_path, txt):
         f.write(txt)
 
 
+def read_json_records(file_path):
+    """
+    Reads a list of records from either a JSON array file or a newline-delimited JSON (.jsonl) file. A truncated final
+    line in a .jsonl file (e.g., the writer was killed mid-record) is dropped.
+    """
+    if path.splitext(file_path)[1] != JsonLinesWriter.FILE_EXT:
+        with open(file_path, 'r') as f:
+            return json.load(f)
+    records = []
+    with open(file_path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                logger.warning('Skipping malformed record in {}'.format(file_path))
+    return records
+
+
+class JsonLinesWriter(object):
+    """
+    Appends records as compact newline-delimited JSON as they arrive, keeping nothing in memory. The file is flushed
+    and fsync'd at most every `fsync_interval` seconds, and on close.
+    """
+    FILE_EXT = '.jsonl'
+
+    def __init__(self, file_path, fsync_interval=10):
+        self.file_path = file_path
+        self.fsync_interval = fsync_interval
+        self.num_records = 0
+        self._lock = threading.Lock()
+        self._file = open(file_path, 'w')
+        self._last_sync = monotonic()
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def write(self, record):
+        line = json.dumps(record, separators=(',', ':'), sort_keys=True)
+        with self._lock:
+            self._file.write(line + '\n')
+            self.num_records += 1
+            if monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_sync = monotonic()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+                self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
 def unpickle_object(file_path):
     with open(file_path, 'r') as f:
         obj = cPickle.load(f)
@@ -32,6 +101,21 @@ def pickle_object(obj, file_path):
         cPickle.dump(obj, f)
 
 
+def write_json_atomic(file_path, obj):
+    """ Write obj as JSON so that file_path always holds either the old or the new content, never a partial write"""
+    tmp_file_path = file_path + '.tmp'
+    with open(tmp_file_path, 'w') as f:
+        json.dump(obj, f, indent=4, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    try:
+        os.rename(tmp_file_path, file_path)
+    except OSError:
+        # Windows will not rename over an existing file
+        remove(file_path)
+        os.rename(tmp_file_path, file_path)
+
+
 def get_usr_input(msg, err, validator):
         res = None
         while res is None:
@@ -76,4 +160,26 @@ def kill_proc_tree(pid, including_parent=True):
     gone, still_alive = psutil.wait_procs(children, timeout=5)
     if including_parent:
         parent.kill()
-        parent.wait(5)
\ No newline at end of file
+        parent.wait(5)
+
+
+# psutil has no cpu_affinity on macOS
+CAN_PIN_CPUS = hasattr(psutil.Process, 'cpu_affinity')
+
+
+def pin_proc_tree(pid, cpus):
+    """
+    Restrict a process and its current children to the given CPU numbers (Linux and Windows only: see CAN_PIN_CPUS).
+    Processes that have exited or cannot be accessed are skipped.
+    """
+    try:
+        parent = psutil.Process(pid)
+        processes = [parent] + parent.children(recursive=True)
+    except psutil.Error as e:
+        logger.warning('Cannot pin process {}: {}'.format(pid, e))
+        return
+    for process in processes:
+        try:
+            process.cpu_affinity(list(cpus))
+        except psutil.Error as e:
+            logger.debug('Cannot pin process {}: {}'.format(process.pid, e))
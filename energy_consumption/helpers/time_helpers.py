@@ -0,0 +1,226 @@
+import ctypes
+import ctypes.util
+import logging
+import math
+import os
+import sys
+import time
+
+from mixins import NameMixin
+
+logger = logging.getLogger(__name__)
+
+try:
+    from time import monotonic
+    IS_MONOTONIC = True
+except ImportError:
+    try:
+        from monotonic import monotonic
+        IS_MONOTONIC = True
+    except (ImportError, RuntimeError) as e:
+        # the wall clock can jump (e.g., NTP steps), shifting every schedule and timestamp along with it
+        logger.warning('No monotonic clock ({}): falling back to time.time. Install the monotonic package'.format(e))
+        monotonic = time.time
+        IS_MONOTONIC = False
+
+try:
+    from time import monotonic_ns
+except ImportError:
+    def monotonic_ns():
+        return int(monotonic() * 1e9)
+
+
+def process_time():
+    """ CPU time of the whole process, i.e. of all its threads"""
+    times = os.times()
+    return times[0] + times[1]
+
+
+def get_clock_gettime_thread_time():
+    """ Per-thread CPU clock: clock_gettime(CLOCK_THREAD_CPUTIME_ID), as time.thread_time uses. None if unavailable"""
+    clock_id = {'linux': 3, 'darwin': 16}.get(sys.platform.rstrip('0123456789'))
+    if clock_id is None:
+        return None
+
+    class Timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    # older glibc keeps clock_gettime in librt
+    for lib_name in ('c', 'rt'):
+        lib_path = ctypes.util.find_library(lib_name)
+        try:
+            clock_gettime = ctypes.CDLL(lib_path, use_errno=True).clock_gettime
+        except (OSError, AttributeError):
+            continue
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(Timespec)]
+        timespec = Timespec()
+        if clock_gettime(clock_id, ctypes.byref(timespec)) != 0:
+            return None
+
+        def thread_time():
+            clock_gettime(clock_id, ctypes.byref(timespec))
+            return timespec.tv_sec + timespec.tv_nsec / 1e9
+        return thread_time
+    return None
+
+
+def get_psutil_thread_time():
+    """ Per-thread CPU time from psutil's per-thread times on Windows, matched by thread id. None if unavailable"""
+    if sys.platform != 'win32':
+        return None
+    try:
+        import psutil
+        get_current_thread_id = ctypes.windll.kernel32.GetCurrentThreadId
+    except (ImportError, AttributeError):
+        return None
+    process = psutil.Process()
+
+    def thread_time():
+        thread_id = get_current_thread_id()
+        for thread in process.threads():
+            if thread.id == thread_id:
+                return thread.user_time + thread.system_time
+        return 0.0
+    return thread_time
+
+
+try:
+    from time import thread_time
+    IS_THREAD_TIME_PER_THREAD = True
+except ImportError:
+    # Python 2 has no time.thread_time: read the same clock directly where the platform has one
+    thread_time = get_clock_gettime_thread_time() or get_psutil_thread_time()
+    IS_THREAD_TIME_PER_THREAD = thread_time is not None
+    if thread_time is None:
+        # process CPU time includes concurrent threads: only report it as such (see IS_THREAD_TIME_PER_THREAD)
+        thread_time = process_time
+
+class DeadlineScheduler(NameMixin):
+    """
+    Fixed-rate ticks on a monotonic clock: tick n is due at start + n * interval, regardless of how long the work
+    done on the previous tick took. Ticks whose deadline has already passed are skipped (and counted) rather than
+    stretching the period, so the sampling grid never drifts.
+
+    The interval can be changed from another thread with set_interval: the pending tick then fires immediately and
+    the following ones are spaced by the new interval.
+
+    Usage:
+        scheduler = DeadlineScheduler(interval=1, duration=60)
+        for tick in scheduler:
+            do_work()
+    """
+    # longest uninterrupted sleep, i.e. the latency with which set_interval takes effect
+    MAX_SLEEP = 0.05
+
+    def __init__(self, interval, duration=None, **kwargs):
+        """
+        :param interval: float. Seconds between tick deadlines
+        :param duration: float. Seconds after which no further ticks are issued. None runs forever
+        :param kwargs:
+            clock: callable. Returns seconds on a monotonic clock. Default monotonic
+            sleep: callable. Default time.sleep
+            start: float. Clock time of tick 0, e.g. a t0 shared with other schedulers. Default when iteration begins
+        """
+        self.validate_interval(interval)
+        self.interval = interval
+        self.duration = duration
+        self.clock = kwargs.get('clock', monotonic)
+        if 'clock' not in kwargs and not IS_MONOTONIC:
+            logger.warning('{}: scheduling on the wall clock: ticks will shift if it is stepped'.format(self.name))
+        self.sleep = kwargs.get('sleep', time.sleep)
+        self.start_at = kwargs.get('start', None)
+        self.origin = None
+        self.start = None
+        self.tick = 0
+        self.missed_ticks = 0
+        self.overruns = []
+        self.max_lateness = 0.0
+        self.interval_changes = 0
+        self._changed = False
+        self._stopped = False
+
+    def validate_interval(self, interval):
+        if interval <= 0:
+            raise ValueError('{}: interval must be positive, got {}'.format(self.name, interval))
+
+    def __iter__(self):
+        self.origin = self.start = self.clock() if self.start_at is None else self.start_at
+        self.tick = 0
+        # a start in the future is waited for; a start in the past just means tick 0 fires late
+        while not self._stopped and not self.expired(self.tick) and self.clock() < self.start:
+            self.sleep(min(self.start - self.clock(), self.MAX_SLEEP))
+        while not self._stopped and not self.expired(self.tick):
+            yield self.tick
+            self.wait_next()
+
+    def deadline(self, tick):
+        return self.start + tick * self.interval
+
+    def expired(self, tick):
+        return self.duration is not None and self.deadline(tick) - self.origin >= self.duration
+
+    def stop(self):
+        """ Issue no further ticks: iteration ends within MAX_SLEEP, even mid-wait (callable from another thread)"""
+        self._stopped = True
+
+    def set_interval(self, interval):
+        """ Re-anchor the grid so the pending tick is due now and later ticks follow every `interval` seconds"""
+        self.validate_interval(interval)
+        if interval == self.interval:
+            return
+        self.interval = interval
+        self.interval_changes += 1
+        if self.start is not None:
+            self.start = self.clock() - self.tick * interval
+            self._changed = True
+
+    def wait_next(self):
+        """
+        Sleep until the next deadline. If the work overran it, fire immediately on the latest tick whose deadline has
+        passed, counting any ticks skipped over along the way.
+        """
+        self._changed = False
+        now = self.clock()
+        next_tick = self.tick + 1
+        lateness = now - self.deadline(next_tick)
+        if lateness > 0:
+            # realign to the grid: the tick whose slot we are currently in
+            skip_to = max(next_tick, int(math.floor((now - self.start) / self.interval)))
+            missed = skip_to - next_tick
+            self.missed_ticks += missed
+            self.max_lateness = max(self.max_lateness, lateness)
+            self.overruns.append({'tick': self.tick, 'lateness': lateness, 'missed_ticks': missed})
+            logger.warning('{}: tick {} overran the next deadline by {:.3f} sec, skipping {} tick(s)'.format(
+                self.name, self.tick, lateness, missed))
+            self.tick = skip_to
+            return
+        self.tick = next_tick
+        # sleep in short slices so an interval change is picked up promptly
+        while not self._changed and not self._stopped and not self.expired(next_tick):
+            remaining = self.deadline(next_tick) - self.clock()
+            if remaining <= 0:
+                break
+            self.sleep(min(remaining, self.MAX_SLEEP))
+
+    @property
+    def stats(self):
+        return {'interval': self.interval, 'duration': self.duration, 'last_tick': self.tick,
+                'missed_ticks': self.missed_ticks, 'num_overruns': len(self.overruns),
+                'max_lateness': self.max_lateness, 'interval_changes': self.interval_changes,
+                'overruns': self.overruns}
+
+
+def summarize_latencies(latencies):
+    """
+    :param latencies: list of float. Seconds
+    :return: dict. count, mean, p50, p95 and max of the latencies
+    """
+    if not latencies:
+        return {'count': 0, 'mean': None, 'p50': None, 'p95': None, 'max': None}
+    ordered = sorted(latencies)
+
+    def percentile(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {'count': len(ordered), 'mean': sum(ordered) / len(ordered), 'p50': percentile(0.5),
+            'p95': percentile(0.95), 'max': ordered[-1]}
@@ -0,0 +1,130 @@
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from mixins import NameMixin
+from energy_consumption.helpers.time_helpers import monotonic, summarize_latencies
+
+logger = logging.getLogger(__name__)
+
+
+class SharedMarionette(NameMixin):
+    """
+    One Marionette session shared by the tasks and the sampled data retrievers. Marionette is strictly
+    request/response over a single socket, so callers take turns through `request`; priority callers (the samplers)
+    go ahead of waiting ordinary ones (the tasks).
+
+    Page loads are what would otherwise hold the socket for seconds: the session is started with the "none" page load
+    strategy and SessionClient waits for loads by polling in short slices, releasing the session in between so
+    sampling carries on during navigation.
+
+    The time each request waits for its turn is recorded per caller (see `stats`).
+    """
+    PAGE_LOAD_CAPABILITIES = {'pageLoadStrategy': 'none'}
+    # set on the current document before navigating to a token unique to the navigation: any other value (or none)
+    # means another document has replaced it, including one restored from the back-forward cache, which keeps the
+    # token of the navigation away from it
+    NAVIGATION_MARKER = '__energyConsumptionNavigation'
+    # scripts run in a fresh sandbox by default, where an expando set by an earlier script is not visible: marking and
+    # checking share one persistent sandbox instead
+    NAVIGATION_SANDBOX = 'navigation'
+
+    def __init__(self, client, **kwargs):
+        """
+        :param client: Marionette. Session already started, with PAGE_LOAD_CAPABILITIES
+        :param kwargs:
+            page_load_timeout: float. Default 60. Seconds to wait for a page load before giving up
+            page_load_poll_interval: float. Default 0.1
+        """
+        self.client = client
+        self.page_load_timeout = kwargs.get('page_load_timeout', 60)
+        self.page_load_poll_interval = kwargs.get('page_load_poll_interval', 0.1)
+        self._condition = threading.Condition(threading.Lock())
+        self._busy = False
+        self._num_waiting_priority = 0
+        self.wait_times = {}
+
+    @contextmanager
+    def request(self, caller, priority=False):
+        """
+        Exclusive use of the client for the duration of the with block. Hold it across anything relying on session
+        state, e.g. using_context.
+
+        :param caller: str. Name the wait time is recorded under
+        :param priority: bool. Go ahead of waiting non-priority callers
+        """
+        enqueued = monotonic()
+        with self._condition:
+            if priority:
+                self._num_waiting_priority += 1
+            while self._busy or (not priority and self._num_waiting_priority):
+                self._condition.wait()
+            if priority:
+                self._num_waiting_priority -= 1
+            self._busy = True
+        self.wait_times.setdefault(caller, []).append(monotonic() - enqueued)
+        try:
+            yield self.client
+        finally:
+            with self._condition:
+                self._busy = False
+                self._condition.notify_all()
+
+    def mark_document(self, client):
+        """ Tag the current document ahead of a navigation. Returns the navigation's token"""
+        token = uuid.uuid4().hex
+        client.execute_script('window.{} = arguments[0];'.format(self.NAVIGATION_MARKER), script_args=[token],
+                              sandbox=self.NAVIGATION_SANDBOX, new_sandbox=False)
+        return token
+
+    def is_page_loaded(self, client, token):
+        ready_state, marker = client.execute_script(
+            'return [document.readyState, window.{}];'.format(self.NAVIGATION_MARKER),
+            sandbox=self.NAVIGATION_SANDBOX, new_sandbox=False)
+        return ready_state == 'complete' and marker != token
+
+    def wait_for_page_load(self, caller, token):
+        start = monotonic()
+        while monotonic() - start < self.page_load_timeout:
+            with self.request(caller) as client:
+                if self.is_page_loaded(client, token):
+                    return
+            time.sleep(self.page_load_poll_interval)
+        logger.warning('{}: page load not complete after {} sec'.format(self.name, self.page_load_timeout))
+
+    def proxy(self, caller):
+        return SessionClient(self, caller)
+
+    @property
+    def stats(self):
+        return {caller: summarize_latencies(wait_times) for caller, wait_times in self.wait_times.items()}
+
+
+class SessionClient(object):
+    """
+    Stand-in for a Marionette client: every method call takes its turn on the SharedMarionette session, and page
+    loading calls return once the page has loaded, as with the default page load strategy. Context managers such as
+    using_context need the session held throughout: use SharedMarionette.request for those instead.
+    """
+    # calls that start a page load
+    PAGE_LOADING_METHODS = ('navigate', 'refresh', 'go_back', 'go_forward')
+
+    def __init__(self, session, caller):
+        self.session = session
+        self.caller = caller
+
+    def __getattr__(self, name):
+        attr = getattr(self.session.client, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            with self.session.request(self.caller) as client:
+                token = self.session.mark_document(client) if name in self.PAGE_LOADING_METHODS else None
+                result = getattr(client, name)(*args, **kwargs)
+            if token is not None:
+                self.session.wait_for_page_load(self.caller, token)
+            return result
+        return call
@@ -0,0 +1,189 @@
+import errno
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from os import path, getcwd
+
+from mozprofile import Profile
+
+from mixins import NameMixin
+from energy_consumption.helpers.time_helpers import monotonic
+
+logger = logging.getLogger(__name__)
+
+# linux/fs.h: _IOW(0x94, 9, int), clone a whole file sharing its extents (Btrfs, XFS)
+FICLONE = 0x40049409
+
+
+def clone_file(src_file_path, dst_file_path):
+    """ Copy-on-write clone where the file system supports it (Linux FICLONE), else a plain copy"""
+    if sys.platform.startswith('linux'):
+        # Unix only: imported here so the module still loads on Windows
+        import fcntl
+        with open(src_file_path, 'rb') as src, open(dst_file_path, 'wb') as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                shutil.copystat(src_file_path, dst_file_path)
+                return 'cloned'
+            except (IOError, OSError) as e:
+                if e.errno not in (errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL, errno.ENOTTY, errno.EBADF):
+                    raise
+    shutil.copy2(src_file_path, dst_file_path)
+    return 'copied'
+
+
+class ProfileManager(NameMixin):
+    """
+    Builds a prepared Firefox profile template once, then hands out cheap clones of it, so each launch starts from a
+    profile that is already created, has its prefs written, its extensions scanned and, optionally, caches primed by
+    loading `prime_uris`, instead of paying for all of that during the measurement.
+
+    Packed extensions (.xpi), which Firefox only ever replaces, are hard-linked into the clones. Everything else is
+    cloned copy-on-write where the file system supports it, else copied: databases and prefs, but also cache entries
+    and the startup cache, whose metadata Firefox rewrites in place.
+
+    The template is rebuilt whenever its prefs or prime_uris change. The time of the cold launch that built it is kept
+    in `template_info`; pass the manager to an Experiment or Campaign to have the warm launch time on the clone
+    recorded next to it.
+    """
+    DEFAULT_PREFS = {'browser.tabs.remote.autostart': True,
+                     # no first-run pages, default browser checks or update downloads competing with the measurement
+                     'browser.startup.homepage_override.mstone': 'ignore',
+                     'browser.shell.checkDefaultBrowser': False,
+                     'app.update.enabled': False,
+                     'datareporting.policy.dataSubmissionEnabled': False,
+                     # keep the disk cache inside the profile so it is part of the template
+                     'browser.cache.disk.parent_directory': None}
+    # files that are replaced rather than modified in place, so can be shared between the template and its clones
+    HARDLINK_EXTS = ('.xpi',)
+    INFO_FILE_NAME = 'template_info.json'
+
+    def __init__(self, **kwargs):
+        """
+        Kwargs:
+            template_dir_path: str. Default ff_profile_template in the working directory
+            clones_dir_path: str. Default next to the template, so hard links and clones stay on its file system
+            prefs: dict. Added to (or overriding) DEFAULT_PREFS
+            prime_uris: list of str. Default none. Loaded once while building the template, to warm its caches
+            prime_wait: float. Default 5. Seconds to stay on each prime_uris page
+            headless: bool. Default False
+        """
+        self.template_dir_path = kwargs.get('template_dir_path', path.join(getcwd(), 'ff_profile_template'))
+        self.clones_dir_path = kwargs.get('clones_dir_path', self.template_dir_path + '_clones')
+        self.prefs = dict(self.DEFAULT_PREFS)
+        self.prefs.update(kwargs.get('prefs', {}))
+        self.prime_uris = list(kwargs.get('prime_uris', ()))
+        self.prime_wait = kwargs.get('prime_wait', 5)
+        self.headless = kwargs.get('headless', False)
+        self.template_info = None
+        self.clones = {}
+        # campaigns running side by side share one manager: the template is built once
+        self._template_lock = threading.Lock()
+
+    @property
+    def info_file_path(self):
+        return path.join(self.template_dir_path, self.INFO_FILE_NAME)
+
+    def get_prefs(self, profile_dir_path):
+        prefs = dict(self.prefs)
+        if 'browser.cache.disk.parent_directory' in prefs:
+            prefs['browser.cache.disk.parent_directory'] = profile_dir_path
+        return prefs
+
+    def load_template_info(self):
+        if not path.isfile(self.info_file_path):
+            return None
+        with open(self.info_file_path, 'r') as f:
+            template_info = json.load(f)
+        if template_info['prefs'] != self.prefs or template_info['prime_uris'] != self.prime_uris:
+            logger.info('{}: template {} is out of date'.format(self.name, self.template_dir_path))
+            return None
+        return template_info
+
+    def ensure_template(self):
+        """ Build the template unless an up to date one exists. Returns its template_info"""
+        with self._template_lock:
+            if self.template_info is None:
+                self.template_info = self.load_template_info() or self.build_template()
+        return self.template_info
+
+    def build_template(self):
+        # imported here: experiment imports this module
+        from energy_consumption.experiment import start_client
+        build_dir_path = tempfile.mkdtemp(prefix='ff_profile_build_', dir=path.dirname(self.template_dir_path))
+        logger.info('{}: building profile template in {}'.format(self.name, build_dir_path))
+        start = monotonic()
+        client = start_client(False, headless=self.headless,
+                              profile=Profile(profile=build_dir_path, preferences=self.get_prefs(build_dir_path),
+                                              restore=False))
+        cold_launch_time = monotonic() - start
+        for uri in self.prime_uris:
+            client.navigate(uri)
+            time.sleep(self.prime_wait)
+        client.navigate('about:blank')
+        # quitting from within Firefox makes it write everything out to the profile
+        client.quit(in_app=True)
+        if path.isdir(self.template_dir_path):
+            shutil.rmtree(self.template_dir_path)
+        os.rename(build_dir_path, self.template_dir_path)
+        template_info = {'prefs': self.prefs, 'prime_uris': self.prime_uris, 'cold_launch_time': cold_launch_time,
+                         'build_time': monotonic() - start, 'built': time.strftime('%Y%m%d_%H%M%S')}
+        with open(self.info_file_path, 'w') as f:
+            json.dump(template_info, f, indent=4, sort_keys=True)
+        logger.info('{}: cold launch took {:.3f} sec'.format(self.name, cold_launch_time))
+        return template_info
+
+    def is_hardlinkable(self, rel_path):
+        return rel_path.endswith(self.HARDLINK_EXTS)
+
+    def clone(self):
+        """
+        :return: mozprofile.Profile. A fresh clone of the template, used in place by Marionette
+        """
+        self.ensure_template()
+        start = monotonic()
+        if not path.isdir(self.clones_dir_path):
+            os.makedirs(self.clones_dir_path)
+        clone_dir_path = tempfile.mkdtemp(prefix='profile_', dir=self.clones_dir_path)
+        counts = {'linked': 0, 'cloned': 0, 'copied': 0}
+        for dir_path, dir_names, file_names in os.walk(self.template_dir_path):
+            rel_dir_path = path.relpath(dir_path, self.template_dir_path)
+            for dir_name in dir_names:
+                os.mkdir(path.join(clone_dir_path, rel_dir_path, dir_name))
+            for file_name in file_names:
+                rel_path = path.normpath(path.join(rel_dir_path, file_name))
+                if rel_path == self.INFO_FILE_NAME or file_name in ('lock', '.parentlock', 'parent.lock'):
+                    continue
+                src, dst = path.join(self.template_dir_path, rel_path), path.join(clone_dir_path, rel_path)
+                if self.is_hardlinkable(rel_path):
+                    try:
+                        os.link(src, dst)
+                        counts['linked'] += 1
+                        continue
+                    except OSError:
+                        pass
+                counts[clone_file(src, dst)] += 1
+        profile = Profile(profile=clone_dir_path, preferences=self.get_prefs(clone_dir_path), restore=False)
+        self.clones[clone_dir_path] = dict(counts, clone_time=monotonic() - start)
+        logger.debug('{}: cloned the template into {} in {:.3f} sec ({})'.format(
+            self.name, clone_dir_path, self.clones[clone_dir_path]['clone_time'], counts))
+        return profile
+
+    def report(self, profile, warm_launch_time=None):
+        """ Cold (template) and warm (clone) launch times, and the cost of cloning, for a profile from clone"""
+        report = {'template_dir_path': self.template_dir_path, 'profile_dir_path': profile.profile,
+                  'cold_launch_time': self.ensure_template()['cold_launch_time'],
+                  'warm_launch_time': warm_launch_time}
+        report.update(self.clones.get(profile.profile, {}))
+        return report
+
+    def remove(self, profile):
+        """ Delete a clone once its Firefox has quit. Anything not cloned by this manager is left alone"""
+        profile_dir_path = getattr(profile, 'profile', None)
+        if self.clones.pop(profile_dir_path, None) is not None:
+            shutil.rmtree(profile_dir_path, ignore_errors=True)
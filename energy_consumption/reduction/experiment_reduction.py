@@ -6,7 +6,8 @@ from os import path
 import pandas as pd
 
 from energy_consumption.experiment import ExperimentMeta
-from energy_consumption.data_streams.sampled_data import TIMESTAMP_FMT
+from energy_consumption.helpers.io_helpers import read_json_records
+from energy_consumption.data_streams.sampled_data import TIMESTAMP_FMT, iter_full_snapshots
 from energy_consumption.reduction.performance_reduction import agg_sum, filter_one
 
 
@@ -42,19 +43,38 @@ class ExperimentReducer(ExperimentMeta):
     def __init__(self, exp_id, exp_name, **kwargs):
         super(ExperimentReducer, self).__init__(exp_id, exp_name, **kwargs)
 
+    def parse_clock_anchor(self, **kwargs):
+        clock_anchor_file_path = kwargs.get('clock_anchor_file_path', self.clock_anchor_file_path)
+        with open(clock_anchor_file_path, 'r') as f:
+            return json.load(f)
+
+    def parse_timestamps(self, df, **kwargs):
+        """
+        Sets df.timestamp to wall-clock DateTime: from the monotonic `timestamp_ns` column and the experiment's clock
+        anchor if present, else from legacy TIMESTAMP_FMT strings.
+        """
+        if 'timestamp_ns' in df:
+            anchor = self.parse_clock_anchor(**kwargs)
+            anchor_timestamp = pd.Timestamp(datetime.strptime(anchor['timestamp'], TIMESTAMP_FMT))
+            df['timestamp'] = anchor_timestamp + pd.to_timedelta(df.timestamp_ns - anchor['timestamp_ns'], unit='ns')
+        else:
+            df['timestamp'] = pd.to_datetime(df.timestamp, format=TIMESTAMP_FMT)
+        return df
+
     def parse_exp(self, **kwargs):
         exp_file_path = kwargs.get('exp_file_path', self.experiment_file_path)
-        return pd.read_json(exp_file_path, convert_dates=True, orient='records').sort_values('timestamp')
+        exp_df = pd.read_json(exp_file_path, convert_dates=['timestamp'], keep_default_dates=False, orient='records')
+        if 'timestamp_ns' in exp_df:
+            exp_df = self.parse_timestamps(exp_df, **kwargs)
+        return exp_df.sort_values('timestamp')
 
     def parse_perf(self, **kwargs):
         # TODO: use pandas.read_json
         perf_counter_file_path = kwargs.get('perf_counter_file_path', self.perf_counter_file_path)
-        with open(perf_counter_file_path, 'r') as f:
-            results = json.load(f)
+        # either a JSON array or streamed .jsonl, possibly delta-encoded
+        results = list(iter_full_snapshots(read_json_records(perf_counter_file_path)))
         # massage timestamp into DateTime
-        for x in results:
-            x['timestamp'] = datetime.strptime(x['timestamp'], TIMESTAMP_FMT)
-        raw_df = pd.DataFrame(results)
+        raw_df = self.parse_timestamps(pd.DataFrame(results), **kwargs)
         reduce_df = self.reduce_perf_counters(raw_df).sort_values('timestamp')
         # make timestamp index
         reduce_df = reduce_df.set_index(pd.DatetimeIndex(reduce_df.timestamp)).drop('timestamp', axis=1)
@@ -62,6 +82,27 @@ class ExperimentReducer(ExperimentMeta):
         reduce_df = reduce_df.resample('s').ffill(limit=1).interpolate().dropna()
         return {'raw': raw_df, 'reduced': reduce_df}
 
+    def parse_overhead(self, **kwargs):
+        """
+        Harness overhead per sampling interval: CPU seconds used by the harness process and by each retriever's
+        sampling, differenced from the cumulative values HarnessOverheadRetriever records. Retrievers' CPU time is
+        left out where it was only recorded as process_cpu_time (no per-thread CPU clock).
+        """
+        overhead_file_path = kwargs.get('overhead_file_path',
+                                        path.join(self.exp_dir_path, 'harness_overhead_sampled_data.jsonl'))
+        results = read_json_records(overhead_file_path)
+        rows = []
+        for x in results:
+            row = {'timestamp_ns': x['timestamp_ns'], 'harness_cpu': x['process']['user'] + x['process']['system']}
+            for name, overhead in x['retrievers'].items():
+                if 'cpu_time' in overhead:
+                    row['{}_cpu'.format(name)] = overhead['cpu_time']
+                row['{}_wall'.format(name)] = overhead['wall_time']
+            rows.append(row)
+        overhead_df = self.parse_timestamps(pd.DataFrame(rows), **kwargs).drop('timestamp_ns', axis=1)
+        overhead_df = overhead_df.sort_values('timestamp').set_index('timestamp')
+        return overhead_df.diff().dropna()
+
     def parse_hobo(self, **kwargs):
         col_names = kwargs.get('col_names', self.hobo_columns)
         hobo_file_path = kwargs.get('hobo_file_path',
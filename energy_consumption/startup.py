@@ -0,0 +1,109 @@
+import logging
+import threading
+import traceback
+
+from mixins import NameMixin
+from energy_consumption.helpers.time_helpers import monotonic, monotonic_ns
+
+logger = logging.getLogger(__name__)
+
+
+class StartupStream(object):
+    """ One stream brought up by a StartupPipeline"""
+
+    def __init__(self, name, prepare=None, release=None, **kwargs):
+        self.name = name
+        self.prepare = prepare
+        self.release = release
+        self.needs_browser = kwargs.get('needs_browser', False)
+        self.provides_browser = kwargs.get('provides_browser', False)
+        self.ready_latency = None
+        self.release_lateness = None
+        self.error = None
+
+    @property
+    def report(self):
+        return {'ready_latency': self.ready_latency, 'release_lateness': self.release_lateness, 'error': self.error}
+
+
+class StartupPipeline(NameMixin):
+    """
+    Brings streams up concurrently behind a readiness barrier: each stream's prepare (launching Firefox, connecting,
+    constructing the power gadget, ...) runs in its own thread, streams needing the browser waiting only for the one
+    providing it. Once all are ready a single t0 is taken and every stream is released with it, i.e. its release is
+    called with t0 (monotonic() seconds) to start recording, on a grid anchored at t0 where it has one.
+
+    `report` holds t0 and, per stream, the time it took to become ready and how late after t0 its release was called.
+    """
+
+    def __init__(self, timeout=120):
+        """
+        :param timeout: float. Seconds for all streams to become ready before startup fails
+        """
+        self.timeout = timeout
+        self.streams = []
+        self.browser_ready = threading.Event()
+        self.browser_failed = False
+        self.start = None
+        self.t0_ns = None
+        self.ready_time = None
+
+    def add(self, name, prepare=None, release=None, **kwargs):
+        """
+        :param name: str
+        :param prepare: callable. Called without arguments from the stream's startup thread
+        :param release: callable. Called with t0 once all streams are ready
+        :param kwargs:
+            needs_browser: bool. Default False. Prepare only once the browser is up
+            provides_browser: bool. Default False. The browser is up once this stream's prepare returns
+        """
+        self.streams.append(StartupStream(name, prepare, release, **kwargs))
+
+    def prepare_stream(self, stream):
+        try:
+            if stream.needs_browser:
+                if not self.browser_ready.wait(self.timeout) or self.browser_failed:
+                    raise RuntimeError('browser did not start')
+            if stream.prepare is not None:
+                stream.prepare()
+        except Exception as e:
+            stream.error = '{}\n{}'.format(e, traceback.format_exc())
+            logger.error('{}: {} failed to start: {}'.format(self.name, stream.name, e))
+            if stream.provides_browser:
+                self.browser_failed = True
+        finally:
+            stream.ready_latency = monotonic() - self.start
+            if stream.provides_browser:
+                self.browser_ready.set()
+
+    def run(self):
+        """
+        :return: int. t0 in monotonic nanoseconds
+        """
+        self.start = monotonic()
+        threads = []
+        for stream in self.streams:
+            thread = threading.Thread(target=self.prepare_stream, args=(stream,))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join(max(0, self.start + self.timeout - monotonic()))
+        not_ready = [stream.name for stream, thread in zip(self.streams, threads) if thread.is_alive()]
+        failed = [stream.name for stream in self.streams if stream.error is not None]
+        if not_ready or failed:
+            raise RuntimeError('{}: startup failed (not ready: {}, failed: {})'.format(self.name, not_ready, failed))
+        self.ready_time = monotonic() - self.start
+        self.t0_ns = monotonic_ns()
+        t0 = self.t0_ns / 1e9
+        for stream in self.streams:
+            if stream.release is not None:
+                stream.release(t0)
+            stream.release_lateness = monotonic() - t0
+        logger.info('{}: all {} streams ready after {:.3f} sec'.format(self.name, len(self.streams), self.ready_time))
+        return self.t0_ns
+
+    @property
+    def report(self):
+        return {'t0_ns': self.t0_ns, 'ready_time': self.ready_time,
+                'streams': {stream.name: stream.report for stream in self.streams}}
@@ -56,7 +56,7 @@ def run_exp(exp_id, uri):
         sampled_data_retrievers=(PerformanceProcessesRetriever(), PsutilDataRetriever())
     )
 
-    exp.run(wait_interval=10)
+    exp.run()
 
     time.sleep(10)
 
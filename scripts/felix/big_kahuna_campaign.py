@@ -0,0 +1,41 @@
+import logging
+
+from os import path
+from energy_consumption.campaign import Campaign
+from energy_consumption.experiment import Tasks, Task
+from energy_consumption.helpers.io_helpers import log_to_stdout
+from big_kahuna_pages import pages
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+log_to_stdout(logger, level=logging.DEBUG)
+
+
+# same protocol as big_kahuna.py, but Firefox and the samplers stay up across pages
+class PageTasks(Tasks):
+    def __init__(self, uri):
+        super(PageTasks, self).__init__()
+        self.uri = uri
+
+    @property
+    def tasks(self):
+        return [
+            Task('time.sleep(30)', self.client,
+                 meta={'website': 'HOME'}),
+            Task("self.client.navigate('{}')".format(self.uri), self.client,
+                 meta={'website': self.uri}),
+            Task('time.sleep(60)', self.client,
+                 meta={'website': self.uri}),
+            Task("self.client.navigate('about:blank')", self.client,
+                 meta={'website': 'HOME'}),
+            Task('time.sleep(30)', self.client,
+                 meta={'website': 'HOME'}),
+        ]
+
+
+samples_per_page = 5
+campaign = Campaign(
+    campaign_name=path.splitext(path.basename(__file__))[0], items=pages * samples_per_page, duration=120,
+    tasks_factory=lambda exp_id, uri: PageTasks(uri),
+)
+campaign.run()
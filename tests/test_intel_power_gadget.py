@@ -0,0 +1,86 @@
+import json
+import shutil
+import tempfile
+import unittest
+from os import path
+
+import pandas as pd
+
+from energy_consumption.data_streams.intel_power_gadget import IpgTailReader, get_ipg_dtypes, read_ipg, \
+    stitch_ipg_segments
+
+HEADER = '"System Time","RDTSC","Elapsed Time (sec)","Processor Power_0(Watt)"\n'
+FOOTER = '\n"Total Elapsed Time (sec) = 3.0"\n"Average Processor Power_0 (Watt) = 2.0"\n'
+
+
+def get_rows(start_second, num_rows):
+    return ''.join('"12:00:{:02d}:000",{},{:.3f},2.0\n'.format(start_second + i, i, i + 1.0) for i in range(num_rows))
+
+
+class StitchIpgSegmentsTest(unittest.TestCase):
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def write_segment(self, i, txt):
+        file_path = path.join(self.dir_path, 'ipg_{}_.txt'.format(i))
+        with open(file_path, 'w') as f:
+            f.write(txt)
+        return file_path
+
+    def write_segments_file(self, file_paths):
+        segments_file_path = path.join(self.dir_path, 'ipg_segments.json')
+        with open(segments_file_path, 'w') as f:
+            json.dump([{'file_path': file_path, 'start_ns': int(i * 3e9)} for i, file_path in enumerate(file_paths)],
+                      f)
+        return segments_file_path
+
+    def test_truncated_segment_keeps_complete_rows(self):
+        # the second segment is cut off inside its System Time string
+        file_paths = [self.write_segment(0, HEADER + get_rows(0, 3) + FOOTER),
+                      self.write_segment(1, HEADER + get_rows(3, 2) + '"12:00:0'),
+                      self.write_segment(2, HEADER + get_rows(6, 3) + FOOTER)]
+        df, segments = stitch_ipg_segments(file_paths, self.write_segments_file(file_paths))
+        self.assertEqual(list(df.groupby('Segment').size()), [3, 2, 3])
+        self.assertEqual([segment['complete'] for segment in segments], [True, False, True])
+        self.assertEqual([segment['num_rows'] for segment in segments], [3, 2, 3])
+        # the truncated segment's missing last row shows up as a gap before the next
+        self.assertAlmostEqual(segments[2]['gap_before'], 1.0)
+
+    def test_unreadable_segment_is_skipped(self):
+        file_paths = [self.write_segment(0, HEADER + get_rows(0, 3) + FOOTER),
+                      self.write_segment(1, ''),
+                      self.write_segment(2, HEADER + get_rows(6, 3) + FOOTER)]
+        df, segments = stitch_ipg_segments(file_paths, self.write_segments_file(file_paths))
+        self.assertEqual(sorted(df['Segment'].unique()), [0, 2])
+        self.assertIsNotNone(segments[1]['error'])
+        self.assertAlmostEqual(segments[2]['gap_before'], 3.0)
+
+    def test_read_ipg_drops_partial_row(self):
+        file_path = self.write_segment(0, HEADER + get_rows(0, 2) + '"12:00:02:000",2,3.0')
+        self.assertEqual(len(read_ipg(file_path)), 2)
+
+
+class IpgTailReaderTest(unittest.TestCase):
+    def test_rdtsc_keeps_full_precision(self):
+        # beyond 2 ** 53, where a float64 starts rounding
+        rdtsc = 2 ** 60 + 1
+        dir_path = tempfile.mkdtemp()
+        try:
+            file_path = path.join(dir_path, 'ipg_1_.txt')
+            with open(file_path, 'w') as f:
+                f.write(HEADER + '"12:00:00:000",{},1.000,2.0\n'.format(rdtsc) + FOOTER)
+            reader = IpgTailReader(file_path, poll_interval=0.01).start()
+            self.assertTrue(reader.wait(timeout=5))
+            self.assertEqual(reader.rows[0]['RDTSC'], rdtsc)
+            df = pd.DataFrame(reader.rows, columns=reader.header).astype(get_ipg_dtypes(reader.header))
+            self.assertEqual(df['RDTSC'].iloc[0], rdtsc)
+            self.assertEqual(df['RDTSC'].iloc[0], read_ipg(file_path)['RDTSC'].iloc[0])
+        finally:
+            shutil.rmtree(dir_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import unittest
+
+from energy_consumption.marionette_session import SharedMarionette
+
+
+class FakeDocument(object):
+    def __init__(self, url, ready_state):
+        self.url = url
+        self.ready_state = ready_state
+        # expandos set on the window, per sandbox they were set from
+        self.expandos = {}
+
+
+class FakeMarionette(object):
+    """
+    Marionette with the "none" page load strategy: navigating returns straight away and the old document stays loaded
+    for a few polls. Then navigate and refresh load a new document for a few more polls, while go_back and go_forward
+    restore the neighbouring document from the back-forward cache, already complete and with its expandos intact.
+    Each execute_script runs in a fresh sandbox unless a named sandbox is reused, as in Marionette.
+    """
+
+    def __init__(self, polls_before_unload=3, polls_loading=3):
+        self.polls_before_unload = polls_before_unload
+        self.polls_loading = polls_loading
+        self.history = [FakeDocument('about:blank', 'complete')]
+        self.index = 0
+        self.pending = None
+        self.num_sandboxes = 0
+
+    @property
+    def document(self):
+        return self.history[self.index]
+
+    def navigate(self, url):
+        self.pending = [lambda: self.load(url), self.polls_before_unload, self.polls_loading]
+
+    def refresh(self):
+        self.pending = [lambda: self.load(self.document.url, replace=True), self.polls_before_unload,
+                        self.polls_loading]
+
+    def go_back(self):
+        self.pending = [lambda: self.restore(self.index - 1), self.polls_before_unload, 0]
+
+    def go_forward(self):
+        self.pending = [lambda: self.restore(self.index + 1), self.polls_before_unload, 0]
+
+    def load(self, url, replace=False):
+        if not replace:
+            del self.history[self.index + 1:]
+            self.history.append(None)
+            self.index += 1
+        self.history[self.index] = FakeDocument(url, 'loading')
+
+    def restore(self, index):
+        self.index = index
+
+    def advance(self):
+        if self.pending is None:
+            return
+        if self.pending[1]:
+            self.pending[1] -= 1
+        elif self.pending[0] is not None:
+            self.pending[0]()
+            self.pending[0] = None
+        elif self.pending[2]:
+            self.pending[2] -= 1
+        else:
+            self.document.ready_state = 'complete'
+            self.pending = None
+
+    def execute_script(self, script, script_args=(), new_sandbox=True, sandbox='default'):
+        if new_sandbox:
+            self.num_sandboxes += 1
+            sandbox = '{}_{}'.format(sandbox, self.num_sandboxes)
+        expandos = self.document.expandos.setdefault(sandbox, {})
+        if script.startswith('window.'):
+            expandos[SharedMarionette.NAVIGATION_MARKER] = script_args[0]
+            return None
+        ready_state = self.document.ready_state
+        marker = expandos.get(SharedMarionette.NAVIGATION_MARKER)
+        self.advance()
+        return [ready_state, marker]
+
+
+class SessionClientTest(unittest.TestCase):
+    def test_navigate_waits_for_new_document(self):
+        client = FakeMarionette()
+        session = SharedMarionette(client, page_load_timeout=5, page_load_poll_interval=0)
+        session.proxy('tasks').navigate('https://example.com')
+        self.assertEqual(client.document.url, 'https://example.com')
+        self.assertEqual(client.document.ready_state, 'complete')
+
+    def test_navigate_waits_while_old_document_loaded(self):
+        client = FakeMarionette(polls_before_unload=10, polls_loading=0)
+        session = SharedMarionette(client, page_load_timeout=5, page_load_poll_interval=0)
+        session.proxy('tasks').navigate('https://example.com')
+        self.assertEqual(client.document.url, 'https://example.com')
+
+    def test_refresh_waits_for_new_document(self):
+        client = FakeMarionette()
+        client.history[0] = FakeDocument('https://example.com', 'complete')
+        first = client.document
+        session = SharedMarionette(client, page_load_timeout=5, page_load_poll_interval=0)
+        session.proxy('tasks').refresh()
+        self.assertIsNot(client.document, first)
+        self.assertEqual(client.document.ready_state, 'complete')
+
+    def test_go_back_and_forward_wait_for_restored_document(self):
+        client = FakeMarionette()
+        session = SharedMarionette(client, page_load_timeout=5, page_load_poll_interval=0)
+        tasks_client = session.proxy('tasks')
+        tasks_client.navigate('https://example.com')
+        tasks_client.navigate('https://example.org')
+        # each document restored from the cache is still tagged from the navigation away from it
+        tasks_client.go_back()
+        self.assertEqual(client.document.url, 'https://example.com')
+        self.assertIsNone(client.pending)
+        tasks_client.go_back()
+        self.assertEqual(client.document.url, 'about:blank')
+        tasks_client.go_forward()
+        self.assertEqual(client.document.url, 'https://example.com')
+        self.assertIsNone(client.pending)
+
+
+if __name__ == '__main__':
+    unittest.main()
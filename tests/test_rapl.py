@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+import unittest
+from os import path
+
+import numpy as np
+
+from energy_consumption.data_streams.intel_power_gadget import IntelPowerGadget, read_ipg
+from energy_consumption.data_streams.rapl import RaplPowerGadget, RaplZone
+
+
+class FakePowercap(object):
+    """ A /sys/class/powercap-like tree of intel-rapl zones, with writable energy counters"""
+
+    def __init__(self, dir_path):
+        self.dir_path = dir_path
+
+    def add_zone(self, zone_id, name, energy_uj=0, max_energy_range_uj=262143328850):
+        zone_dir_path = path.join(self.dir_path, 'intel-rapl:{}'.format(zone_id))
+        os.mkdir(zone_dir_path)
+        with open(path.join(zone_dir_path, 'name'), 'w') as f:
+            f.write(name + '\n')
+        with open(path.join(zone_dir_path, 'max_energy_range_uj'), 'w') as f:
+            f.write('{}\n'.format(max_energy_range_uj))
+        self.set_energy(zone_id, energy_uj)
+        return zone_dir_path
+
+    def set_energy(self, zone_id, energy_uj):
+        with open(path.join(self.dir_path, 'intel-rapl:{}'.format(zone_id), 'energy_uj'), 'w') as f:
+            f.write('{}\n'.format(energy_uj))
+
+
+class RaplTest(unittest.TestCase):
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.powercap = FakePowercap(self.dir_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def test_zone_update_wraps_around(self):
+        zone = RaplZone(self.powercap.add_zone(0, 'package-0', energy_uj=999000, max_energy_range_uj=999999))
+        try:
+            self.assertEqual(zone.update(), 0.0)
+            self.powercap.set_energy(0, 999500)
+            self.assertAlmostEqual(zone.update(), 0.0005)
+            # the counter wraps past max_energy_range_uj back to 0: 499 uj up to it, 1 to wrap, 500 after
+            self.powercap.set_energy(0, 500)
+            self.assertAlmostEqual(zone.update(), 0.001)
+            self.assertAlmostEqual(zone.cumulative_joules, 0.0015)
+        finally:
+            zone.close()
+
+    def test_zones_map_onto_powerlog_domains(self):
+        self.powercap.add_zone('0', 'package-0')
+        self.powercap.add_zone('0:0', 'core')
+        self.powercap.add_zone('1', 'package-1')
+        self.powercap.add_zone('2', 'psys')
+        gadget = RaplPowerGadget(sysfs_root_path=self.dir_path, threaded=False)
+        try:
+            self.assertEqual([gadget.zone_label(zone) for zone in gadget.zones],
+                             ['Processor_0', 'Processor_1', 'IA_0'])
+        finally:
+            gadget.close()
+
+    def test_output_reads_back_as_powerlog(self):
+        self.powercap.add_zone('0', 'package-0')
+        self.powercap.add_zone('0:0', 'core')
+        gadget = RaplPowerGadget(sysfs_root_path=self.dir_path, sampling_rate=100, duration=0.3,
+                                 output_file_path=path.join(self.dir_path, 'powerlog'), threaded=False)
+        try:
+            output_file_path = gadget.get_output_file_path()
+            gadget.run(gadget.duration, output_file_path)
+        finally:
+            gadget.close()
+        self.assertEqual(gadget.get_header(),
+                         ['System Time', 'RDTSC', 'Elapsed Time (sec)', 'CPU Utilization(%)', 'CPU Frequency_0(MHz)',
+                          'Processor Power_0(Watt)', 'Cumulative Processor Energy_0(Joules)',
+                          'Cumulative Processor Energy_0(mWh)', 'IA Power_0(Watt)', 'Cumulative IA Energy_0(Joules)',
+                          'Cumulative IA Energy_0(mWh)'])
+        with open(output_file_path, 'r') as f:
+            txt = f.read()
+        footer = txt[txt.index(IntelPowerGadget.FOOTER_TAG):].splitlines()
+        self.assertTrue(footer[0].startswith('"Total Elapsed Time (sec) = '))
+        self.assertEqual(len(footer), 1 + 3 * len(gadget.zones))
+        df, summary = read_ipg(output_file_path, with_summary=True)
+        self.assertEqual(list(df.columns), gadget.get_header())
+        # one row per 100 ms tick, fewer if a loaded machine skips some
+        self.assertTrue(1 <= len(df) <= 3)
+        self.assertEqual(df['RDTSC'].dtype, np.int64)
+        self.assertEqual(summary['Cumulative Processor Energy_0 (Joules)'], 0.0)
+        self.assertIn('Average IA Power_0 (Watt)', summary)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+
+from energy_consumption.helpers.time_helpers import DeadlineScheduler
+
+
+class FakeClock(object):
+    """ Time that only moves when slept through or worked through, with an optional hook called on each sleep"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.on_sleep = None
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+        if self.on_sleep is not None:
+            self.on_sleep()
+
+
+class DeadlineSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def make_scheduler(self, interval, duration=None, **kwargs):
+        return DeadlineScheduler(interval, duration, clock=self.clock, sleep=self.clock.sleep, **kwargs)
+
+    def run_ticks(self, scheduler, work=None, max_ticks=100):
+        """ [(tick, time it fired)], calling work(tick) on each"""
+        fired = []
+        for tick in scheduler:
+            fired.append((tick, round(self.clock.now, 6)))
+            if work is not None:
+                work(tick)
+            if len(fired) >= max_ticks:
+                break
+        return fired
+
+    def test_ticks_on_fixed_grid(self):
+        scheduler = self.make_scheduler(1, 5)
+        # work taking less than the interval does not stretch the period
+        fired = self.run_ticks(scheduler, work=lambda tick: self.clock.sleep(0.3))
+        self.assertEqual(fired, [(0, 0.0), (1, 1.0), (2, 2.0), (3, 3.0), (4, 4.0)])
+        self.assertEqual(scheduler.stats['missed_ticks'], 0)
+
+    def test_overrun_skips_missed_deadlines(self):
+        scheduler = self.make_scheduler(1, 5)
+
+        def work(tick):
+            if tick == 1:
+                self.clock.now += 2.5
+
+        fired = self.run_ticks(scheduler, work=work)
+        # tick 2's deadline passed during the overrun: tick 3 fires straight away, then the grid carries on
+        self.assertEqual(fired, [(0, 0.0), (1, 1.0), (3, 3.5), (4, 4.0)])
+        stats = scheduler.stats
+        self.assertEqual(stats['missed_ticks'], 1)
+        self.assertEqual(stats['num_overruns'], 1)
+        self.assertAlmostEqual(stats['max_lateness'], 1.5)
+
+    def test_set_interval_fires_pending_tick_and_respaces(self):
+        scheduler = self.make_scheduler(1)
+
+        def on_sleep():
+            # as if from another thread, while waiting for tick 3
+            if scheduler.tick == 3 and self.clock.now >= 2.2 and scheduler.interval == 1:
+                scheduler.set_interval(0.5)
+
+        self.clock.on_sleep = on_sleep
+        fired = self.run_ticks(scheduler, max_ticks=6)
+        self.assertEqual([tick for tick, _ in fired], [0, 1, 2, 3, 4, 5])
+        self.assertEqual([at for _, at in fired[:3]], [0.0, 1.0, 2.0])
+        self.assertAlmostEqual(fired[4][1] - fired[3][1], 0.5)
+        self.assertAlmostEqual(fired[5][1] - fired[4][1], 0.5)
+        # the pending tick fired as soon as the interval changed, not at its old deadline
+        self.assertLess(fired[3][1], 2.3)
+        self.assertEqual(scheduler.stats['interval_changes'], 1)
+
+    def test_shared_start_in_future(self):
+        scheduler = self.make_scheduler(1, 2, start=3.0)
+        self.assertEqual(self.run_ticks(scheduler), [(0, 3.0), (1, 4.0)])
+
+    def test_stop_ends_iteration(self):
+        scheduler = self.make_scheduler(1)
+        fired = self.run_ticks(scheduler, work=lambda tick: tick == 2 and scheduler.stop())
+        self.assertEqual([tick for tick, _ in fired], [0, 1, 2])
+
+    def test_invalid_interval(self):
+        self.assertRaises(ValueError, self.make_scheduler, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()